@@ -19,6 +19,7 @@ YTB_RESOLUTION_KEY = "ytb_resolution"
 def process_video(file, dubbing=False, is_retry=False):
     if not is_retry:
         prepare_output_folder(OUTPUT_DIR)
+    prewarm_nlp()  # load spaCy for the splitting step while Whisper runs, it stays loaded for the next videos
     
     text_steps = [
         ("🎥 Processing input file", partial(process_input_file, file)),
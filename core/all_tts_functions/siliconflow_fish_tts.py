@@ -7,7 +7,7 @@ from typing import List, Tuple
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
 from core.config_utils import load_key, update_key
 from core.step1_ytdlp import find_video_files
-from core.all_whisper_methods.whisperX_utils import get_audio_duration
+from core.media_probe import get_audio_duration
 import hashlib
 from rich import print as rprint
 from pydub import AudioSegment
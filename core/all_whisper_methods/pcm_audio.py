@@ -0,0 +1,101 @@
+import os, sys, shutil, struct, subprocess
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import numpy as np
+from threading import Lock
+from rich import print
+from core.media_probe import probe
+
+# Decoded audio lives here as raw PCM behind a small header, so every stage maps it instead of decoding again
+PCM_DIR = "output/audio/pcm"
+MAGIC = b"VLPCM001"
+# magic, sample rate, channels, dtype code, frames, source mtime_ns, source size
+HEADER = struct.Struct("<8sIHHQqQ")
+HEADER_SIZE = 64  # keeps the samples aligned
+DTYPES = {1: ("float32", "f32le"), 2: ("int16", "s16le")}
+DTYPE_CODES = {name: code for code, (name, _) in DTYPES.items()}
+
+_OPEN = {}
+_OPEN_LOCK = Lock()
+
+class PcmAudio:
+    """A decoded audio file mapped into memory, `samples` is (frames,) for mono and (frames, channels) otherwise"""
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            magic, self.sample_rate, self.channels, dtype_code, frames, _, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a PCM cache file: {path}")
+        self.path = path
+        self.dtype = DTYPES[dtype_code][0]
+        shape = (frames,) if self.channels == 1 else (frames, self.channels)
+        # copy-on-write: consumers that insist on writable arrays get them without touching the file
+        self.samples = np.memmap(path, dtype=self.dtype, mode="c", offset=HEADER_SIZE, shape=shape) if frames else np.zeros(shape, self.dtype)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def slice(self, start: float, end: float = None) -> np.ndarray:
+        """Zero-copy view of `start`-`end` seconds"""
+        first = max(0, int(round(start * self.sample_rate)))
+        last = len(self.samples) if end is None else min(len(self.samples), int(round(end * self.sample_rate)))
+        return self.samples[first:last]
+
+def _cache_path(source: str, sample_rate: int, channels: int, dtype: str) -> str:
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(PCM_DIR, f"{name}.{sample_rate}hz.{channels}ch.{dtype}.pcm")
+
+def _is_fresh(path: str, source_stat) -> bool:
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return False
+    magic, _, _, _, _, mtime_ns, size = HEADER.unpack(header)
+    return magic == MAGIC and mtime_ns == source_stat.st_mtime_ns and size == source_stat.st_size
+
+def decode_to_pcm(source: str, sample_rate: int = None, channels: int = None, dtype: str = "float32") -> str:
+    """Decode `source` once with ffmpeg into a PCM cache file and return its path.
+    `sample_rate`/`channels` default to the source's own. The file is rebuilt only when the source changes."""
+    if sample_rate is None or channels is None:
+        native = next(stream for stream in probe(source)["streams"] if stream["codec_type"] == "audio")
+        sample_rate = sample_rate or native["sample_rate"]
+        channels = channels or native["channels"]
+    path = _cache_path(source, sample_rate, channels, dtype)
+    source_stat = os.stat(source)
+    if _is_fresh(path, source_stat):
+        return path
+
+    print(f"🎵 Decoding <{source}> to {sample_rate} Hz {channels}ch {dtype} PCM ...")
+    os.makedirs(PCM_DIR, exist_ok=True)
+    code = DTYPE_CODES[dtype]
+    tmp_path = f"{path}.tmp"
+    cmd = ["ffmpeg", "-v", "error", "-i", source, "-vn", "-ac", str(channels), "-ar", str(sample_rate), "-f", DTYPES[code][1], "pipe:1"]
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER_SIZE)
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        shutil.copyfileobj(process.stdout, f, 1 << 20)
+        stderr = process.communicate()[1]
+        if process.returncode != 0:
+            f.close()
+            os.remove(tmp_path)
+            raise RuntimeError(f"Failed to decode {source}: {stderr.decode(errors='ignore')}")
+        frames = (f.tell() - HEADER_SIZE) // (np.dtype(dtype).itemsize * channels)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, sample_rate, channels, code, frames, source_stat.st_mtime_ns, source_stat.st_size))
+    os.replace(tmp_path, path)
+    return path
+
+def open_pcm(source: str, sample_rate: int = None, channels: int = None, dtype: str = "float32") -> PcmAudio:
+    """Decoded, memory-mapped audio of `source`, shared by every caller in the process"""
+    with _OPEN_LOCK:
+        path = decode_to_pcm(source, sample_rate, channels, dtype)
+        stamp = os.stat(path).st_mtime_ns
+        if path not in _OPEN or _OPEN[path][0] != stamp:
+            _OPEN[path] = (stamp, PcmAudio(path))
+        return _OPEN[path][1]
+
+def close_all():
+    """Drop every mapping, e.g. before the output folder is archived"""
+    with _OPEN_LOCK:
+        _OPEN.clear()
@@ -0,0 +1,64 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import numpy as np
+from bisect import bisect_right
+from rich import print
+from core.all_whisper_methods.pcm_audio import PcmAudio
+
+FRAME_SEC = 0.01
+BLOCK_FRAMES = 60 * 100  # one minute of frames per vectorized pass, bounds memory on long files
+FLOOR_DB = -120.0
+
+def compute_rms_db(audio: PcmAudio, frame_sec: float = FRAME_SEC) -> np.ndarray:
+    """Framewise RMS level in dBFS, float16, one value per `frame_sec`"""
+    frame_len = max(1, int(round(audio.sample_rate * frame_sec)))
+    samples = audio.samples
+    scale = 32768.0 if audio.dtype == "int16" else 1.0
+    n_frames = len(samples) // frame_len
+    levels = np.empty(n_frames, dtype=np.float16)
+    for first in range(0, n_frames, BLOCK_FRAMES):
+        last = min(n_frames, first + BLOCK_FRAMES)
+        block = np.asarray(samples[first * frame_len:last * frame_len], dtype=np.float32) / scale
+        block = block.reshape(last - first, -1)  # frame samples (and channels) along axis 1
+        power = np.mean(np.square(block), axis=1)
+        levels[first:last] = np.maximum(10 * np.log10(np.maximum(power, 1e-12)), FLOOR_DB)
+    return levels
+
+class SilenceIndex:
+    """Silence runs of one audio file, found with one vectorized pass and queried by bisection"""
+    def __init__(self, levels: np.ndarray, frame_sec: float = FRAME_SEC):
+        self.levels = levels
+        self.frame_sec = frame_sec
+        self._runs = {}
+
+    def silences(self, threshold_db: float = -30, min_duration: float = 0.5):
+        """(starts, ends) in seconds of every run quieter than `threshold_db` lasting at least `min_duration`"""
+        key = (threshold_db, min_duration)
+        if key not in self._runs:
+            quiet = np.concatenate(([0], (self.levels < threshold_db).astype(np.int8), [0]))
+            edges = np.diff(quiet)
+            starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            keep = (ends - starts) * self.frame_sec >= min_duration
+            self._runs[key] = ((starts[keep] * self.frame_sec).tolist(), (ends[keep] * self.frame_sec).tolist())
+        return self._runs[key]
+
+    def silence_ends_between(self, start: float, end: float, threshold_db: float = -30, min_duration: float = 0.5) -> list:
+        """Ends of the silences that end within `start`-`end`, in order"""
+        ends = self.silences(threshold_db, min_duration)[1]
+        return ends[bisect_right(ends, start):bisect_right(ends, end)]
+
+    def next_silence_end(self, after: float, before: float = float('inf'), threshold_db: float = -30, min_duration: float = 0.5):
+        """The first silence end after `after` and no later than `before`, None if there is none"""
+        ends = self.silences(threshold_db, min_duration)[1]
+        i = bisect_right(ends, after)
+        return ends[i] if i < len(ends) and ends[i] <= before else None
+
+def load_silence_index(audio: PcmAudio, frame_sec: float = FRAME_SEC) -> SilenceIndex:
+    """The silence index of `audio`, computed once and kept next to its PCM file"""
+    path = f"{os.path.splitext(audio.path)[0]}.{int(frame_sec * 1000)}ms.rms.npy"
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(audio.path):
+        return SilenceIndex(np.load(path), frame_sec)
+    print("[blue]🔇 Indexing silence ...[/blue]")
+    levels = compute_rms_db(audio, frame_sec)
+    np.save(path, levels)
+    return SilenceIndex(levels, frame_sec)
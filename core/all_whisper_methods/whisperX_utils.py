@@ -4,50 +4,13 @@ from typing import Dict, List, Tuple
 from rich import print
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from core.config_utils import update_key
+from core.media_probe import get_audio_duration, has_audio
+from core.all_whisper_methods.pcm_audio import PcmAudio
+from core.all_whisper_methods.silence_index import load_silence_index
 
 AUDIO_DIR = "output/audio"
 RAW_AUDIO_FILE = "output/audio/raw.m4a"
 CLEANED_CHUNKS_EXCEL_PATH = "output/log/cleaned_chunks.xlsx"
-WHISPER_FILE = "output/audio/for_whisper.m4a"
-
-def compress_audio(input_file: str, output_file: str):
-    """将输入音频文件压缩为低质量音频文件，用于转录"""
-    if not os.path.exists(output_file):
-        print(f"🗜️ Converting to low quality audio with FFmpeg ......")
-        try:
-            # 验证输入文件是否存在
-            if not os.path.exists(input_file):
-                raise FileNotFoundError(f"Input file not found: {input_file}")
-            
-            # 确保输出目录存在
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
-            
-            # 规范化文件路径
-            input_file = os.path.normpath(input_file)
-            output_file = os.path.normpath(output_file)
-            
-            # 使用 AAC 编码器
-            subprocess.run([
-                'ffmpeg', '-y',
-                '-i', input_file,
-                '-c:a', 'aac',           # 使用 AAC 编码器
-                '-ar', '16000',          # 采样率
-                '-ac', '1',              # 单声道
-                '-b:a', '32k',           # 比特率
-                output_file
-            ], check=True, stderr=subprocess.PIPE)
-                
-            print(f"🗜️ Converted <{input_file}> to <{output_file}> with FFmpeg")
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode() if e.stderr else str(e)
-            print(f"[red]Error during audio compression: {error_msg}[/red]")
-            if os.path.exists(output_file):
-                os.remove(output_file)
-            raise
-        except Exception as e:
-            print(f"[red]Unexpected error: {str(e)}[/red]")
-            raise
-    return output_file
 
 def convert_video_to_audio(video_file: str):
     """将视频文件转换为音频文件"""
@@ -68,13 +31,7 @@ def convert_video_to_audio(video_file: str):
                 raise ValueError(f"Video file is empty: {video_file}")
             
             # 先检查视频文件是否包含音频流
-            probe_cmd = [
-                'ffmpeg',
-                '-i', video_file,
-                '-hide_banner'
-            ]
-            probe_result = subprocess.run(probe_cmd, capture_output=True, text=True)
-            if 'Stream #0:1' not in probe_result.stderr:  # 通常音频流是 #0:1
+            if not has_audio(video_file):
                 raise ValueError(f"No audio stream found in video file: {video_file}")
             
             # 使用 AAC 编码器
@@ -113,41 +70,12 @@ def convert_video_to_audio(video_file: str):
             raise
     return RAW_AUDIO_FILE
 
-def _detect_silence(audio_file: str, start: float, end: float) -> List[float]:
-    """Detect silence points in the given audio segment"""
-    cmd = ['ffmpeg', '-y', '-i', audio_file, 
-           '-ss', str(start), '-to', str(end),
-           '-af', 'silencedetect=n=-30dB:d=0.5', 
-           '-f', 'null', '-']
-    
-    output = subprocess.run(cmd, capture_output=True, text=True, 
-                          encoding='utf-8').stderr
-    
-    return [float(line.split('silence_end: ')[1].split(' ')[0])
-            for line in output.split('\n')
-            if 'silence_end' in line]
-
-def get_audio_duration(audio_file: str) -> float:
-    """Get the duration of an audio file using ffmpeg."""
-    cmd = ['ffmpeg', '-i', audio_file]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    _, stderr = process.communicate()
-    output = stderr.decode('utf-8', errors='ignore')
-    
-    try:
-        duration_str = [line for line in output.split('\n') if 'Duration' in line][0]
-        duration_parts = duration_str.split('Duration: ')[1].split(',')[0].split(':')
-        duration = float(duration_parts[0])*3600 + float(duration_parts[1])*60 + float(duration_parts[2])
-    except Exception as e:
-        print(f"[red]❌ Error: Failed to get audio duration: {e}[/red]")
-        duration = 0
-    return duration
-
-def split_audio(audio_file: str, target_len: int = 30*60, win: int = 60) -> List[Tuple[float, float]]:
-    # 30 min 16000 Hz 96kbps ~ 22MB < 25MB required by whisper
+def split_audio(audio: PcmAudio, target_len: int = 30*60, win: int = 60) -> List[Tuple[float, float]]:
+    """Cut `audio` into ~`target_len` segments, each ending at the first silence after its target length (within `win`)"""
     print("[bold blue]🔪 Starting audio segmentation...[/]")
     
-    duration = get_audio_duration(audio_file)
+    duration = audio.duration
+    silence = load_silence_index(audio)
     
     segments = []
     pos = 0
@@ -157,15 +85,11 @@ def split_audio(audio_file: str, target_len: int = 30*60, win: int = 60) -> List
             break
         win_start = pos + target_len - win
         win_end = min(win_start + 2 * win, duration)
-        silences = _detect_silence(audio_file, win_start, win_end)
-    
-        if silences:
-            target_pos = target_len - (win_start - pos)
-            split_at = next((t for t in silences if t - win_start > target_pos), None)
-            if split_at:
-                segments.append((pos, split_at))
-                pos = split_at
-                continue
+        split_at = silence.next_silence_end(pos + target_len, win_end)
+        if split_at:
+            segments.append((pos, split_at))
+            pos = split_at
+            continue
         segments.append((pos, pos + target_len))
         pos += target_len
     
@@ -1,116 +1,157 @@
 import os, sys, json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from threading import Lock
 import json_repair
 import json 
-from openai import OpenAI
-import time
+import httpx
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI
 from requests.exceptions import RequestException
 from core.config_utils import load_key
+from core.gpt_log import save_log
+from core.llm_cache import make_cache_key, get_cached_response, cache_response, MISS
+from core.llm_engine import run_sync, rate_limited
 from typing import Union, Dict
 
-LOG_FOLDER = 'output/gpt_log'
-LOCK = Lock()
+TEMPERATURE = 0.7
+TIMEOUT = 120.0
 
-def save_log(model, prompt, response, log_title = 'default', message = None):
-    os.makedirs(LOG_FOLDER, exist_ok=True)
-    log_data = {
-        "model": model,
-        "prompt": prompt,
-        "response": response,
-        "message": message
-    }
-    log_file = os.path.join(LOG_FOLDER, f"{log_title}.json")
-    
-    if os.path.exists(log_file):
-        with open(log_file, 'r', encoding='utf-8') as f:
-            logs = json.load(f)
-    else:
-        logs = []
-    logs.append(log_data)
-    with open(log_file, 'w', encoding='utf-8') as f:
-        json.dump(logs, f, ensure_ascii=False, indent=4)
-        
-def check_ask_gpt_history(prompt, model, log_title):
-    # check if the prompt has been asked before
-    if not os.path.exists(LOG_FOLDER):
-        return False
-    file_path = os.path.join(LOG_FOLDER, f"{log_title}.json")
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            for item in data:
-                if item["prompt"] == prompt and item["model"] == model:
-                    return item["response"]
-    return False
+# One pooled client per (base_url, key, pool settings), only ever touched from the engine loop
+_CLIENTS = {}
+# Requests in flight per client; a client replaced by a config change is retired and closed by its last request
+_IN_FLIGHT = {}
+_RETIRED = set()
 
-def ask_gpt(prompt: str, response_json: bool = False, valid_def=None, log_title: str = None) -> Union[str, Dict]:
-    # 检查历史记录
-    history_response = check_ask_gpt_history(prompt, load_key("api.model"), log_title)
-    if history_response:
-        return history_response
+async def get_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """Return the shared keep-alive client for this endpoint, building it only when the config changed"""
+    pool = load_key("llm_client")
+    http2 = pool['http2'] and importlib.util.find_spec('h2') is not None
+    client_key = (base_url, api_key, pool['max_connections'], pool['max_keepalive_connections'], http2)
+    if client_key not in _CLIENTS:
+        # The same endpoint under an old pool config is stale, close it once no request uses it
+        for stale_key in [k for k in _CLIENTS if k[:2] == (base_url, api_key)]:
+            stale = _CLIENTS.pop(stale_key)
+            if stale in _IN_FLIGHT:
+                _RETIRED.add(stale)
+            else:
+                await stale.close()
+        http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=pool['max_connections'], max_keepalive_connections=pool['max_keepalive_connections']),
+            timeout=TIMEOUT,
+            trust_env=False,  # skip proxies
+        )
+        _CLIENTS[client_key] = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=TIMEOUT, max_retries=5, http_client=http_client)
+    return _CLIENTS[client_key]
+
+@asynccontextmanager
+async def use_client(base_url: str, api_key: str):
+    """Hold the shared client for one request, so a config change cannot close it under the request"""
+    client = await get_client(base_url, api_key)
+    _IN_FLIGHT[client] = _IN_FLIGHT.get(client, 0) + 1
+    try:
+        yield client
+    finally:
+        _IN_FLIGHT[client] -= 1
+        if not _IN_FLIGHT[client]:
+            del _IN_FLIGHT[client]
+            if client in _RETIRED:
+                _RETIRED.discard(client)
+                await client.close()
+
+def _lookup_cache(cache_key: str, valid_def):
+    """Blocking (SQLite), runs in a worker thread"""
+    cached_response = get_cached_response(cache_key)
+    if cached_response is not MISS and (not valid_def or valid_def(cached_response)['status'] == 'success'):
+        return cached_response
+    return MISS
+
+def _accept_response(model: str, prompt: str, result: str, response_json: bool, valid_def, log_title: str, cache_key: str, use_cache: bool):
+    """Log, parse, validate and cache one response; raises if it is unusable.
+    Blocking (log queue, json_repair, validator, SQLite), runs in a worker thread"""
+    # 保存成功的响应到历史记录
+    if log_title:
+        save_log(model, prompt, result, log_title)
+
+    if response_json:
+        try:
+            response_data = json_repair.loads(result)
+            if valid_def:
+                valid_response = valid_def(response_data)
+                if valid_response['status'] != 'success':
+                    save_log(model, prompt, response_data, log_title="error", message=valid_response['message'])
+                    raise ValueError(f"❎ API response error: {valid_response['message']}")
+        except Exception as e:
+            print(f"❎ json_repair parsing failed. Retrying: '''{result}'''")
+            save_log(model, prompt, result, log_title="error", message=f"json_repair parsing failed.")
+            raise
+        result = response_data
+    elif valid_def:
+        valid_response = valid_def(result)
+        if valid_response['status'] != 'success':
+            save_log(model, prompt, result, log_title="error", message=valid_response['message'])
+            raise ValueError(f"❎ API response error: {valid_response['message']}")
+
+    if use_cache:
+        cache_response(cache_key, result)
+    return result
+
+async def ask_gpt_async(prompt: str, response_json: bool = False, valid_def=None, log_title: str = None) -> Union[str, Dict]:
+    """Ask the LLM under the global concurrency limit and the provider's rpm/tpm budget.
+    `valid_def` checks the parsed JSON, or the text when `response_json` is False. Only responses that pass it
+    are cached; text responses without a `valid_def` are never cached, a bad one would be replayed on every retry.
+    Cache, log and validation work runs in worker threads, the engine loop only waits on the network."""
+    api_set = load_key("api")
+    model, base_url, api_key = api_set['model'], api_set['base_url'], api_set['key']
+
+    # 检查缓存
+    use_cache = response_json or valid_def is not None
+    cache_key = make_cache_key(model, base_url, prompt, TEMPERATURE, response_json)
+    if use_cache:
+        cached_response = await asyncio.to_thread(_lookup_cache, cache_key, valid_def)
+        if cached_response is not MISS:
+            return cached_response
 
     # 设置环境变量跳过代理
     os.environ['no_proxy'] = '*'
-    
-    # 打印详细的 API 设置
-    print("\n[blue]Using API settings:[/blue]")
-    print(f"base_url: {load_key('api.base_url')}")
-    print(f"model: {load_key('api.model')}")
-    print(f"key: {load_key('api.key')[:8]}...")  # 只显示 key 的前几位
+
+    quiet = load_key("llm_client.quiet")
+    if not quiet:
+        # 打印详细的 API 设置
+        print("\n[blue]Using API settings:[/blue]")
+        print(f"base_url: {base_url}")
+        print(f"model: {model}")
+        print(f"key: {api_key[:8]}...")  # 只显示 key 的前几位
     
     try:
-        client = OpenAI(
-            api_key=load_key("api.key"),
-            base_url=load_key("api.base_url"),
-            timeout=120.0,
-            max_retries=5
-        )
-        
-        # 测试连接
-        print(f"\n[yellow]Testing connection to {load_key('api.base_url')}...[/yellow]")
-        
         max_retries = 5
         retry_delay = 3
         
         for attempt in range(max_retries):
             try:
-                response = client.chat.completions.create(
-                    model=load_key("api.model"),
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    timeout=120.0
-                )
+                async with use_client(base_url, api_key) as client, rate_limited(base_url, prompt) as report_usage:
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=TEMPERATURE,
+                        timeout=TIMEOUT
+                    )
+                    if response.usage:
+                        report_usage(response.usage.total_tokens)
                 
                 result = response.choices[0].message.content
-                print("[green]✓ API connection successful[/green]")
-                
-                # 保存成功的响应到历史记录
-                if log_title:
-                    save_log(load_key("api.model"), prompt, result, log_title)
-                
-                if response_json:
-                    try:
-                        response_data = json_repair.loads(result)
-                        if valid_def:
-                            valid_response = valid_def(response_data)
-                            if valid_response['status'] != 'success':
-                                save_log(load_key("api.model"), prompt, response_data, log_title="error", message=valid_response['message'])
-                                raise ValueError(f"❎ API response error: {valid_response['message']}")
-                        return response_data
-                    except Exception as e:
-                        print(f"❎ json_repair parsing failed. Retrying: '''{result}'''")
-                        save_log(load_key("api.model"), prompt, result, log_title="error", message=f"json_repair parsing failed.")
-                        raise
+                if not quiet:
+                    print("[green]✓ API connection successful[/green]")
                 
-                return result
+                return await asyncio.to_thread(_accept_response, model, prompt, result, response_json, valid_def, log_title, cache_key, use_cache)
                 
             except Exception as e:
                 print(f"[red]Attempt {attempt + 1} failed: {str(e)}[/red]")
                 if attempt < max_retries - 1:
                     delay = retry_delay * (2 ** attempt)
                     print(f"[yellow]Retrying in {delay} seconds...[/yellow]")
-                    time.sleep(delay)
+                    await asyncio.sleep(delay)
                     continue
                 raise
                 
@@ -118,6 +159,10 @@ def ask_gpt(prompt: str, response_json: bool = False, valid_def=None, log_title:
         print(f"[red]Failed to initialize OpenAI client: {str(e)}[/red]")
         raise
 
+def ask_gpt(prompt: str, response_json: bool = False, valid_def=None, log_title: str = None) -> Union[str, Dict]:
+    """Blocking wrapper over `ask_gpt_async`, the request itself runs on the shared engine loop"""
+    return run_sync(ask_gpt_async(prompt, response_json=response_json, valid_def=valid_def, log_title=log_title))
+
 
 if __name__ == '__main__':
     print(ask_gpt('hi there hey response in json format, just return 200.' , response_json=True, log_title=None))
\ No newline at end of file
@@ -1,5 +1,9 @@
 from ruamel.yaml import YAML
 from typing import Any
+from types import MappingProxyType
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
 import os, sys
 import threading
 
@@ -11,21 +15,87 @@ config_lock = threading.Lock()
 yaml = YAML()
 yaml.preserve_quotes = True
 
-def load_key(key: str) -> Any:
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _file_stamp(path: str) -> tuple:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+class ConfigSnapshot:
+    """Immutable parsed view of `config.yaml` at one point in time.
+    Hand one to a job that must see a consistent config while `update_key` is writing."""
+    def __init__(self, data, stamp: tuple):
+        self._data = _freeze(data)
+        self.stamp = stamp
+
+    def load_key(self, key: str) -> Any:
+        value = self._data
+        for k in key.split('.'):
+            if isinstance(value, Mapping) and k in value:
+                value = value[k]
+            else:
+                raise KeyError(f"Key '{k}' not found in configuration")
+        return value
+
+    def with_value(self, key: str, value: Any) -> 'ConfigSnapshot':
+        """A copy with `key` set to `value`"""
+        def replace(data, keys):
+            if not keys:
+                return _freeze(value)
+            return MappingProxyType({**data, keys[0]: replace(data[keys[0]], keys[1:])})
+        return ConfigSnapshot(replace(self._data, key.split('.')), self.stamp)
+
+class ConfigPin:
+    """The config a running job reads: the snapshot taken when it started, plus the job's own `update_key` writes"""
+    def __init__(self, snapshot: ConfigSnapshot):
+        self.snapshot = snapshot
+
+_snapshot = None
+_PIN = ContextVar('config_pin', default=None)
+
+def get_snapshot() -> ConfigSnapshot:
+    """Return the current snapshot, re-parsing only when the file's mtime or size changed"""
+    global _snapshot
+    stamp = _file_stamp(CONFIG_PATH)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.stamp == stamp:
+        return snapshot
     with config_lock:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
-            data = yaml.load(file)
+        stamp = _file_stamp(CONFIG_PATH)
+        if _snapshot is None or _snapshot.stamp != stamp:
+            with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
+                _snapshot = ConfigSnapshot(yaml.load(file), stamp)
+        return _snapshot
 
-    keys = key.split('.')
-    value = data
-    for k in keys:
-        if isinstance(value, dict) and k in value:
-            value = value[k]
-        else:
-            raise KeyError(f"Key '{k}' not found in configuration")
-    return value
+def current_pin() -> ConfigPin:
+    """The pin of the running job, None outside one. Hand it to event loops and threads that do not inherit the context"""
+    return _PIN.get()
+
+@contextmanager
+def pinned_config(pin: ConfigPin = None):
+    """Make `load_key` in this context read `pin`, by default the config as it is now, so editing `config.yaml`
+    does not change a running job. Also a decorator for the entry point of a step. Nested steps keep the outer pin"""
+    if pin is None and _PIN.get() is not None:
+        yield _PIN.get()
+        return
+    pin = pin or ConfigPin(get_snapshot())
+    token = _PIN.set(pin)
+    try:
+        yield pin
+    finally:
+        _PIN.reset(token)
+
+def load_key(key: str) -> Any:
+    pin = _PIN.get()
+    return (pin.snapshot if pin is not None else get_snapshot()).load_key(key)
 
 def update_key(key: str, new_value: Any) -> bool:
+    global _snapshot
     with config_lock:
         with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
             data = yaml.load(file)
@@ -42,6 +112,11 @@ def update_key(key: str, new_value: Any) -> bool:
             current[keys[-1]] = new_value
             with open(CONFIG_PATH, 'w', encoding='utf-8') as file:
                 yaml.dump(data, file)
+            _snapshot = ConfigSnapshot(data, _file_stamp(CONFIG_PATH))
+            pin = _PIN.get()
+            if pin is not None:
+                # A job sees its own writes, not the other edits the file got since it started
+                pin.snapshot = pin.snapshot.with_value(key, new_value)
             return True
         else:
             raise KeyError(f"Key '{keys[-1]}' not found in configuration")
@@ -0,0 +1,125 @@
+import os, sys, json, time, glob, atexit
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import queue
+from threading import Thread, Lock
+from rich import print
+
+LOG_FOLDER = 'output/gpt_log'
+QUEUE_SIZE = 1000  # producers block once this many records are pending, which bounds memory
+FSYNC_INTERVAL = 2.0  # seconds
+
+_QUEUE = queue.Queue(maxsize=QUEUE_SIZE)
+_SYNC = object()  # queued by `flush_logs`: fsync everything written so far
+_WRITER = None
+_WRITER_LOCK = Lock()
+
+def _log_path(log_title: str, folder: str = LOG_FOLDER) -> str:
+    return os.path.join(folder, f"{log_title}.jsonl")
+
+def _writer_loop():
+    """Single consumer: append each record as one JSONL line.
+    Lines reach the OS whenever the queue drains, fsync runs at most every FSYNC_INTERVAL and when `flush_logs` asks"""
+    files = {}
+    unsynced = False
+    last_sync = time.time()
+    while True:
+        try:
+            item = _QUEUE.get(timeout=FSYNC_INTERVAL)
+        except queue.Empty:
+            item = None
+        try:
+            if item is not None and item is not _SYNC:
+                log_title, record = item
+                path = _log_path(log_title)
+                if path not in files or not os.path.exists(path):
+                    # The folder may have been archived by `cleanup` between runs
+                    os.makedirs(LOG_FOLDER, exist_ok=True)
+                    if path in files:
+                        files.pop(path).close()
+                    files[path] = open(path, 'a', encoding='utf-8')
+                files[path].write(json.dumps(record, ensure_ascii=False) + '\n')
+                unsynced = True
+            drained = _QUEUE.empty()
+            if drained:
+                for f in files.values():
+                    f.flush()
+            if unsynced and (item is _SYNC or time.time() - last_sync >= FSYNC_INTERVAL):
+                for f in files.values():
+                    f.flush()
+                    os.fsync(f.fileno())
+                unsynced = False
+                last_sync = time.time()
+            if drained and not unsynced:
+                # Release handles while idle so the folder can be moved or deleted
+                for f in files.values():
+                    f.close()
+                files.clear()
+        except Exception as e:
+            # Losing a log record must neither kill the writer nor leave `flush_logs` waiting forever
+            print(f"[red]❌ Failed to write GPT log: {e}[/red]")
+            for f in files.values():
+                try:
+                    f.close()
+                except Exception:
+                    pass
+            files.clear()
+            unsynced = False
+        finally:
+            if item is not None:
+                _QUEUE.task_done()
+
+def _ensure_writer():
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None or not _WRITER.is_alive():
+            _WRITER = Thread(target=_writer_loop, name='gpt_log_writer', daemon=True)
+            _WRITER.start()
+
+def save_log(model, prompt, response, log_title = 'default', message = None):
+    """Queue one record for `output/gpt_log/<log_title>.jsonl`, O(1) regardless of log size"""
+    _ensure_writer()
+    log_data = {
+        "model": model,
+        "prompt": prompt,
+        "response": response,
+        "message": message
+    }
+    _QUEUE.put((log_title, log_data))
+
+def flush_logs():
+    """Block until every queued record is written and synced"""
+    if _WRITER is not None:
+        _QUEUE.put(_SYNC)
+        _QUEUE.join()
+
+atexit.register(flush_logs)
+
+def read_log(log_title: str, folder: str = LOG_FOLDER) -> list:
+    """Read a log as a list of records, from the JSONL log and/or a legacy JSON array file"""
+    flush_logs()
+    records = []
+    legacy_file = os.path.join(folder, f"{log_title}.json")
+    if os.path.exists(legacy_file):
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            records.extend(json.load(f))
+    jsonl_file = _log_path(log_title, folder)
+    if os.path.exists(jsonl_file):
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # torn last line after a crash
+    return records
+
+def export_json_logs(folder: str = LOG_FOLDER):
+    """Write every JSONL log back out as the `<log_title>.json` array other tools expect"""
+    flush_logs()
+    for jsonl_file in glob.glob(os.path.join(folder, '*.jsonl')):
+        log_title = os.path.splitext(os.path.basename(jsonl_file))[0]
+        records = read_log(log_title, folder)
+        with open(os.path.join(folder, f"{log_title}.json"), 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=4)
+        os.remove(jsonl_file)
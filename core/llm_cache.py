@@ -0,0 +1,90 @@
+import os, sys, json, time, hashlib, sqlite3
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threading import Lock
+from core.config_utils import load_key
+
+# Sentinel returned on a cache miss, so that falsy responses can still be cached
+MISS = object()
+
+_CONN = None
+_CONN_PATH = None
+_LOCK = Lock()
+_PUTS_SINCE_EVICT = 0
+EVICT_EVERY = 500
+
+def _normalize_prompt(prompt: str) -> str:
+    # Line endings and surrounding whitespace never change the answer, so they must not change the key either
+    return prompt.replace('\r\n', '\n').strip()
+
+def make_cache_key(model: str, base_url: str, prompt: str, temperature: float, response_json: bool) -> str:
+    """Digest of everything that determines an LLM response"""
+    payload = json.dumps([model, base_url.rstrip('/'), _normalize_prompt(prompt), temperature, bool(response_json)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _get_conn():
+    global _CONN, _CONN_PATH
+    path = load_key("llm_cache.path")
+    if _CONN is not None and _CONN_PATH == path:
+        return _CONN
+    if _CONN is not None:
+        _CONN.close()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        created REAL NOT NULL,
+        accessed REAL NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+    _CONN, _CONN_PATH = conn, path
+    _evict(conn)
+    return conn
+
+def _evict(conn):
+    """Drop entries older than `max_age_days`, then the least recently used ones beyond `max_entries`"""
+    max_age_days = load_key("llm_cache.max_age_days")
+    max_entries = load_key("llm_cache.max_entries")
+    if max_age_days:
+        conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - max_age_days * 86400,))
+    if max_entries:
+        conn.execute("""DELETE FROM responses WHERE key IN (
+            SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)""", (max_entries,))
+    conn.commit()
+
+def get_cached_response(key: str):
+    """Return the cached response for `key`, or `MISS`"""
+    if not load_key("llm_cache.enabled"):
+        return MISS
+    with _LOCK:
+        conn = _get_conn()
+        row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return MISS
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+    return json.loads(row[0])
+
+def cache_response(key: str, response) -> None:
+    """Store a validated response under `key`"""
+    global _PUTS_SINCE_EVICT
+    if not load_key("llm_cache.enabled"):
+        return
+    now = time.time()
+    with _LOCK:
+        conn = _get_conn()
+        conn.execute("INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                     (key, json.dumps(response, ensure_ascii=False), now, now))
+        conn.commit()
+        _PUTS_SINCE_EVICT += 1
+        if _PUTS_SINCE_EVICT >= EVICT_EVERY:
+            _PUTS_SINCE_EVICT = 0
+            _evict(conn)
+
+def clear_cache() -> None:
+    with _LOCK:
+        conn = _get_conn()
+        conn.execute("DELETE FROM responses")
+        conn.commit()
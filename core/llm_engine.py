@@ -0,0 +1,118 @@
+import os, sys, time, asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from contextlib import asynccontextmanager
+from threading import Thread, Lock, get_ident
+from urllib.parse import urlparse
+from core.config_utils import load_key, current_pin, pinned_config
+
+# One event loop in one daemon thread serves every LLM request of the process
+_LOOP = None
+_LOOP_THREAD_ID = None
+_LOOP_LOCK = Lock()
+
+# Limiters live on the loop thread only, so they need no locking
+_SEMAPHORE = None
+_SEMAPHORE_SIZE = None
+_BUCKETS = {}
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            def run():
+                global _LOOP_THREAD_ID
+                _LOOP_THREAD_ID = get_ident()
+                asyncio.set_event_loop(loop)
+                loop.run_forever()
+            Thread(target=run, name='llm_engine', daemon=True).start()
+            _LOOP = loop
+    return _LOOP
+
+async def _pinned(coro, pin):
+    with pinned_config(pin):
+        return await coro
+
+def run_sync(coro):
+    """Run a coroutine on the engine loop and block the calling thread until it finishes.
+    The coroutine reads the config the calling job is pinned to"""
+    loop = get_loop()
+    if get_ident() == _LOOP_THREAD_ID:
+        coro.close()
+        raise RuntimeError("Synchronous LLM call made from the engine loop, await the async API instead")
+    pin = current_pin()
+    if pin is not None:
+        coro = _pinned(coro, pin)
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+def run_all(coros, return_exceptions: bool = False) -> list:
+    """Run coroutines concurrently on the engine loop and block until all finish, results in order.
+    How many requests are in flight is up to `llm_rate_limit`, not to a thread count."""
+    async def gather():
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+    return run_sync(gather())
+
+def estimate_tokens(text: str) -> int:
+    # Rough and deliberately pessimistic, CJK is about one token per character
+    return max(1, len(text) // 2)
+
+class TokenBucket:
+    """Refills continuously up to `per_minute`; 0 disables the limit"""
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: int = 1):
+        if not self.capacity:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount: int):
+        """Debit (or refund, if negative) the difference between estimated and actual usage"""
+        if self.capacity:
+            self._refill()
+            self.tokens -= amount
+
+def _provider_limits(base_url: str):
+    host = urlparse(base_url).netloc or base_url
+    rate_limit = load_key("llm_rate_limit")
+    limits = (rate_limit.get('providers') or {}).get(host) or rate_limit['default']
+    return host, limits['rpm'], limits['tpm']
+
+def _get_buckets(base_url: str):
+    host, rpm, tpm = _provider_limits(base_url)
+    key = (host, rpm, tpm)
+    if key not in _BUCKETS:
+        _BUCKETS[key] = (TokenBucket(rpm), TokenBucket(tpm))
+    return _BUCKETS[key]
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _SEMAPHORE, _SEMAPHORE_SIZE
+    max_concurrency = load_key("llm_rate_limit.max_concurrency")
+    if _SEMAPHORE is None or _SEMAPHORE_SIZE != max_concurrency:
+        _SEMAPHORE, _SEMAPHORE_SIZE = asyncio.Semaphore(max_concurrency), max_concurrency
+    return _SEMAPHORE
+
+@asynccontextmanager
+async def rate_limited(base_url: str, prompt: str):
+    """Hold a global concurrency slot and the provider's request/token budget for one request.
+    Yields a callback that reports the actual token usage once the response is in."""
+    rpm_bucket, tpm_bucket = _get_buckets(base_url)
+    estimated = estimate_tokens(prompt)
+    async with _get_semaphore():
+        await rpm_bucket.acquire(1)
+        await tpm_bucket.acquire(estimated)
+        yield lambda used_tokens: tpm_bucket.adjust(used_tokens - estimated)
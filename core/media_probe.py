@@ -0,0 +1,107 @@
+import os, sys, json, struct, subprocess
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threading import Lock
+from rich import print
+
+# (path, size, mtime_ns) -> probe result; a rewritten file gets a new key, so entries never go stale
+_CACHE = {}
+_CACHE_LOCK = Lock()
+MAX_ENTRIES = 4096
+
+WAV_CODECS = {1: "pcm_s{}le", 3: "pcm_f{}le"}
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def _audio_result(format_name: str, codec_name: str, sample_rate: int, channels: int, duration: float) -> dict:
+    return {
+        "format": format_name,
+        "duration": duration,
+        "streams": [{"codec_type": "audio", "codec_name": codec_name, "sample_rate": sample_rate, "channels": channels, "duration": duration}],
+    }
+
+def _probe_wav(path: str):
+    """Read a WAV header in-process, None if the file is not a plain RIFF/RF64 WAV"""
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] not in (b"RIFF", b"RF64") or riff[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = header[:4], struct.unpack("<I", header[4:])[0]
+            if chunk_id == b"fmt ":
+                data = f.read(size + size % 2)
+                if len(data) < 16:
+                    return None
+                codec_tag, channels, sample_rate, byte_rate, _, bits = struct.unpack("<HHIIHH", data[:16])
+                if codec_tag == WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+                    codec_tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (WAV_CODECS.get(codec_tag, "unknown").format(bits), channels, sample_rate, byte_rate)
+            elif chunk_id == b"data":
+                if fmt is None or not fmt[3]:
+                    return None
+                # Streamed (ffmpeg pipe) and RF64 files leave the size unset, the data then runs to the end of the file
+                remaining = file_size - f.tell()
+                data_size = remaining if size == 0xFFFFFFFF or size > remaining else size
+                codec_name, channels, sample_rate, byte_rate = fmt
+                return _audio_result("wav", codec_name, sample_rate, channels, data_size / byte_rate)
+            else:
+                f.seek(size + size % 2, 1)
+
+def _probe_pcm(path: str):
+    from core.all_whisper_methods.pcm_audio import PcmAudio
+    audio = PcmAudio(path)
+    return _audio_result("pcm", audio.dtype, audio.sample_rate, audio.channels, audio.duration)
+
+def _probe_ffprobe(path: str) -> dict:
+    cmd = ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path]
+    data = json.loads(subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", check=True).stdout)
+    streams = []
+    for stream in data.get("streams", []):
+        streams.append({
+            "codec_type": stream.get("codec_type"),
+            "codec_name": stream.get("codec_name"),
+            "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+            "channels": stream.get("channels"),
+            "duration": float(stream["duration"]) if stream.get("duration") else None,
+        })
+    duration = data.get("format", {}).get("duration")
+    return {"format": data.get("format", {}).get("format_name"), "duration": float(duration) if duration else None, "streams": streams}
+
+def probe(path: str) -> dict:
+    """Format, duration and streams (codec_type, codec_name, sample_rate, channels, duration) of a media file.
+    WAV and PCM cache headers are read in-process, anything else takes one ffprobe call. Cached by (path, size, mtime)."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    cached = _CACHE.get(key)
+    if cached is not None:
+        return cached
+    ext = os.path.splitext(path)[1].lower()
+    result = None
+    if ext == ".wav":
+        result = _probe_wav(path)
+    elif ext == ".pcm":
+        result = _probe_pcm(path)
+    if result is None:
+        result = _probe_ffprobe(path)
+    with _CACHE_LOCK:
+        if len(_CACHE) >= MAX_ENTRIES:
+            _CACHE.clear()
+        _CACHE[key] = result
+    return result
+
+def has_audio(path: str) -> bool:
+    return any(stream["codec_type"] == "audio" for stream in probe(path)["streams"])
+
+def get_audio_duration(audio_file: str) -> float:
+    """Duration in seconds, 0 if it cannot be read"""
+    try:
+        duration = probe(audio_file)["duration"]
+        if duration is None:
+            duration = max((s["duration"] or 0 for s in probe(audio_file)["streams"] if s["codec_type"] == "audio"), default=0)
+        return duration
+    except Exception as e:
+        print(f"[red]❌ Error: Failed to get audio duration: {e}[/red]")
+        return 0
@@ -2,6 +2,8 @@ import os, sys
 import glob
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.step1_ytdlp import find_video_files
+from core.gpt_log import export_json_logs
+from core.all_whisper_methods.pcm_audio import close_all, PCM_DIR
 import shutil
 
 def cleanup(history_dir="history"):
@@ -19,6 +21,10 @@ def cleanup(history_dir="history"):
     os.makedirs(log_dir, exist_ok=True)
     os.makedirs(gpt_log_dir, exist_ok=True)
 
+    # Decoded PCM is only a cache of the audio files, don't archive it
+    close_all()
+    shutil.rmtree(PCM_DIR, ignore_errors=True)
+
     # Move non-log files
     for file in glob.glob("output/*"):
         if not file.endswith(('log', 'gpt_log')):
@@ -28,7 +34,8 @@ def cleanup(history_dir="history"):
     for file in glob.glob("output/log/*"):
         move_file(file, log_dir)
 
-    # Move gpt_log files
+    # Move gpt_log files, converted back to the `<log_title>.json` arrays
+    export_json_logs()
     for file in glob.glob("output/gpt_log/*"):
         move_file(file, gpt_log_dir)
 
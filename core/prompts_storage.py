@@ -31,6 +31,34 @@ Split the given subtitle text into {num_parts} parts, each less than {word_limit
 """.strip()
     return split_prompt
 
+def get_batch_split_prompt(sentences):
+    language = load_key("whisper.detected_language")
+    sentences_json = json.dumps({str(i + 1): sentence for i, sentence in enumerate(sentences)}, ensure_ascii=False, indent=4)
+    batch_split_prompt = f"""
+### Role
+You are a professional Netflix subtitle splitter in {language}.
+
+### Task
+Split each of the given sentences into 2 parts, marking the split position with ||.
+
+### Instructions
+1. Split every sentence exactly once, at a natural point like a punctuation mark or a conjunction
+2. Keep both parts roughly equal in length and coherent in meaning
+3. Do not change, add or remove any words or punctuation
+
+### Output Format in JSON
+{{
+    "1": "First part of sentence 1 || second part of sentence 1",
+    "2": "First part of sentence 2 || second part of sentence 2"
+}}
+
+### Given Sentences
+<split_these_sentences>
+{sentences_json}
+</split_these_sentences>
+""".strip()
+    return batch_split_prompt
+
 
 ## ================================================================
 # @ step4_1_summarize.py
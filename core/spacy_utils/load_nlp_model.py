@@ -1,31 +1,87 @@
-import os,sys
+import os,sys,math
 import spacy
 from spacy.cli import download
+from contextlib import contextmanager
+from threading import Thread, Lock
 from rich import print
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from core.config_utils import load_key
 
 SPACY_MODEL_MAP = load_key("spacy_model_map")
 
+# Components the segmentation stages and the rule splitter read: sentences, pos_ and dep_.
+# The rest (ner, lemmatizer, ...) are not even loaded. `transformer` replaces `tok2vec` in the *_trf models
+PARSE_PIPES = ['tok2vec', 'transformer', 'tagger', 'morphologizer', 'attribute_ruler', 'parser']
+
+# Loaded models stay for the whole process, e.g. across every video of a batch
+_MODELS = {}
+_MODELS_LOCK = Lock()
+
 def get_spacy_model(language: str):
     model = SPACY_MODEL_MAP.get(language.lower(), "en_core_web_md")
     if language not in SPACY_MODEL_MAP:
         print(f"[yellow]Spacy model does not support '{language}', using en_core_web_md model as fallback...[/yellow]")
     return model
 
-def init_nlp():
+def _unused_pipes(model: str) -> list:
     try:
-        language = "en" if load_key("whisper.language") == "en" else load_key("whisper.detected_language")
-        model = get_spacy_model(language)
-        print(f"[blue]⏳ Loading NLP Spacy model: <{model}> ...[/blue]")
+        pipeline = spacy.util.get_model_meta(spacy.util.get_package_path(model)).get('pipeline', [])
+    except Exception:
+        return []  # not installed yet
+    return [name for name in pipeline if name not in PARSE_PIPES]
+
+def _load_model(model: str):
+    print(f"[blue]⏳ Loading NLP Spacy model: <{model}> ...[/blue]")
+    try:
+        return spacy.load(model, exclude=_unused_pipes(model))
+    except OSError:
+        print(f"[yellow]Downloading {model} model...[/yellow]")
+        print("[yellow]If download failed, please check your network and try again.[/yellow]")
+        download(model)
+        return spacy.load(model, exclude=_unused_pipes(model))
+
+def load_nlp(language: str):
+    """The spaCy pipeline for `language`, loaded once per process"""
+    model = get_spacy_model(language)
+    with _MODELS_LOCK:
+        if model not in _MODELS:
+            try:
+                _MODELS[model] = _load_model(model)
+            except Exception:
+                raise ValueError(f"❌ Failed to load NLP Spacy model: {model}")
+            print(f"[green]✅ NLP Spacy model loaded successfully![/green]")
+        return _MODELS[model]
+
+def init_nlp():
+    language = "en" if load_key("whisper.language") == "en" else load_key("whisper.detected_language")
+    return load_nlp(language)
+
+def prewarm_nlp():
+    """Start loading the spaCy model in the background, e.g. while Whisper transcribes.
+    With `whisper.language: auto` the language is only known after transcription, so nothing is loaded."""
+    language = load_key("whisper.language")
+    if language == 'auto':
+        return
+    def load():
         try:
-            nlp = spacy.load(model)
-        except:
-            print(f"[yellow]Downloading {model} model...[/yellow]")
-            print("[yellow]If download failed, please check your network and try again.[/yellow]")
-            download(model)
-            nlp = spacy.load(model)
-    except:
-        raise ValueError(f"❌ Failed to load NLP Spacy model: {model}")
-    print(f"[green]✅ NLP Spacy model loaded successfully![/green]")
-    return nlp
\ No newline at end of file
+            load_nlp(language)
+        except Exception as e:
+            print(f"[yellow]Prewarming the spaCy model failed, it will be loaded when needed: {e}[/yellow]")
+    Thread(target=load, name='nlp_prewarm', daemon=True).start()
+
+@contextmanager
+def parse_pipes(nlp):
+    """Run only PARSE_PIPES, in case the model was loaded whole because its package metadata could not be read"""
+    with nlp.select_pipes(enable=[name for name in nlp.pipe_names if name in PARSE_PIPES]):
+        yield nlp
+
+def pipe_docs(nlp, texts: list, batch_size: int = None):
+    """Parse `texts` with `nlp.pipe`, batched and spread over `spacy_pipe.n_process` processes.
+    `batch_size` overrides `spacy_pipe.batch_size`, e.g. for a few long texts"""
+    batch_size = batch_size or load_key("spacy_pipe.batch_size")
+    n_process = load_key("spacy_pipe.n_process")
+    if n_process == -1:
+        n_process = os.cpu_count() or 1
+    # Starting workers only pays off when there is a batch for each of them
+    n_process = max(1, min(n_process, math.ceil(len(texts) / batch_size)))
+    return nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
@@ -1,8 +1,8 @@
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 import os,sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from load_nlp_model import init_nlp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from core.spacy_utils.load_nlp_model import init_nlp
 from rich import print
 
 def analyze_connectors(doc, token):
@@ -81,76 +81,34 @@ def analyze_connectors(doc, token):
     else:
         return True, False
 
-def split_by_connectors(text, context_words=5, nlp=None):
-    doc = nlp(text)
-    sentences = [doc.text]  # init
-    
-    while True:
-        # Handle each task with a single cut
-        # avoiding the fragmentation of a sentence into multiple parts at the same time.
-        split_occurred = False
-        new_sentences = []
-        
-        for sent in sentences:
-            doc = nlp(sent)
-            start = 0
-            
-            for i, token in enumerate(doc):
-                split_before, _ = analyze_connectors(doc, token)
-                
-                if i + 1 < len(doc) and doc[i + 1].text in ["'s", "'re", "'ve", "'ll", "'d"]:
-                    continue
-                
-                left_words = doc[max(0, token.i - context_words):token.i]
-                right_words = doc[token.i+1:min(len(doc), token.i + context_words + 1)]
-                
-                left_words = [word.text for word in left_words if not word.is_punct]
-                right_words = [word.text for word in right_words if not word.is_punct]
-                
-                if len(left_words) >= context_words and len(right_words) >= context_words and split_before:
-                    print(f"[yellow]✂️  Split before '{token.text}': {' '.join(left_words)}| {token.text} {' '.join(right_words)}[/yellow]")
-                    new_sentences.append(doc[start:token.i].text.strip())
-                    start = token.i
-                    split_occurred = True
-                    break
-            
-            if start < len(doc):
-                new_sentences.append(doc[start:].text.strip())
-        
-        if not split_occurred:
-            break
-        
-        sentences = new_sentences
-    
-    return sentences
+def split_by_connectors(span, context_words=5):
+    """Cut a sentence span before connectors, in one pass over the single parse.
+    Context is counted inside the current piece, as if each piece had been cut off and parsed on its own."""
+    sentences = []
+    start = 0
 
-def split_sentences_main(nlp):
-    # Read input sentences
-    with open("output/log/sentence_by_comma.txt", "r", encoding="utf-8") as input_file:
-        sentences = input_file.readlines()
-    
-    all_split_sentences = []
-    # Process each input sentence
-    for sentence in sentences:
-        split_sentences = split_by_connectors(sentence.strip(), nlp = nlp)
-        all_split_sentences.extend(split_sentences)
-    
-    # output to sentence_splitbyconnector.txt
-    with open("output/log/sentence_splitbyconnector.txt", "w+", encoding="utf-8") as output_file:
-        for sentence in all_split_sentences:
-            output_file.write(sentence + "\n")
-        # do not add a newline at the end of the file
-        output_file.seek(output_file.tell() - 1, os.SEEK_SET)
-        output_file.truncate()
+    for i, token in enumerate(span):  # i counts inside the span
+        split_before, _ = analyze_connectors(token.doc, token)
 
-    # delete the original file
-    os.remove("output/log/sentence_by_comma.txt")
-    
-    print("[green]💾 Sentences split by connectors saved to →  `sentence_splitbyconnector.txt`[/green]")
+        if i + 1 < len(span) and span[i + 1].text in ["'s", "'re", "'ve", "'ll", "'d"]:
+            continue
+
+        left_words = span[max(start, i - context_words):i]
+        right_words = span[i+1:min(len(span), i + context_words + 1)]
+
+        left_words = [word.text for word in left_words if not word.is_punct]
+        right_words = [word.text for word in right_words if not word.is_punct]
+
+        if len(left_words) >= context_words and len(right_words) >= context_words and split_before:
+            print(f"[yellow]✂️  Split before '{token.text}': {' '.join(left_words)}| {token.text} {' '.join(right_words)}[/yellow]")
+            sentences.append(span[start:i])
+            start = i
+
+    if start < len(span) or not sentences:
+        sentences.append(span[start:])
+    return sentences
 
 if __name__ == "__main__":
     nlp = init_nlp()
-    split_sentences_main(nlp)
-    # nlp = init_nlp()
-    # a = "and show the specific differences that make a difference between a breakaway that results in a goal in the NHL versus one that doesn't."
-    # print(split_by_connectors(a, nlp))
\ No newline at end of file
+    a = "and show the specific differences that make a difference between a breakaway that results in a goal in the NHL versus one that doesn't."
+    print([sentence.text for sentence in split_by_connectors(nlp(a)[:])])
@@ -2,38 +2,99 @@ import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 import os,sys
 import pandas as pd
+from spacy.tokens import Doc
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from core.spacy_utils.load_nlp_model import init_nlp
+from core.spacy_utils.load_nlp_model import init_nlp, pipe_docs
 from core.config_utils import load_key, get_joiner
 from rich import print
 
-def split_by_mark(nlp):
+# Words per parsed window, and how many trailing words of it are only a look-ahead: boundaries there are not committed
+WINDOW_WORDS = 1000
+OVERLAP_WORDS = 200
+
+def load_words():
+    """The transcript words and the language joiner that puts them together"""
     whisper_language = load_key("whisper.language")
     language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
     joiner = get_joiner(language)
     print(f"[blue]🔍 Using {language} language joiner: '{joiner}'[/blue]")
     chunks = pd.read_excel("output/log/cleaned_chunks.xlsx")
     chunks.text = chunks.text.apply(lambda x: x.strip('"'))
-    
-    # join with joiner
-    input_text = joiner.join(chunks.text.to_list())
+    return chunks.text.to_list(), joiner
 
-    doc = nlp(input_text)
-    assert doc.has_annotation("SENT_START")
+def _token_at(doc, char):
+    """Index of the first token starting at or after `char`"""
+    return next((token.i for token in doc if token.idx >= char), len(doc))
+
+def stream_sentences(nlp, words, joiner, window_words=WINDOW_WORDS, overlap_words=OVERLAP_WORDS):
+    """Parse `words` joined with `joiner` in overlapping windows and yield each sentence as its own Doc, in order.
+    A window starts every `window_words - overlap_words` words, so all windows are known up front and parsed with
+    `pipe_docs`. Each window hands over to the next at a sentence start in the first half of their overlap that the
+    next parse also starts a token at, so every cut has look-ahead and no text is lost or repeated."""
+    assert 0 < overlap_words < window_words, "windows must overlap, or the joiner between them is lost"
+    # Empty words only add joiners, and the timeline matches sentences ignoring whitespace
+    words = [word for word in words if word.strip()]
+    if not words:
+        return
+    stride = window_words - overlap_words
+    firsts = [0]
+    while firsts[-1] + window_words < len(words):
+        firsts.append(firsts[-1] + stride)
+    # char offset of each word in the joined text, indexed by word position
+    offsets = [0]
+    for word in words:
+        offsets.append(offsets[-1] + len(word) + len(joiner))
+    # Windows are large, one per batch lets every worker process take one
+    docs = pipe_docs(nlp, [joiner.join(words[first:first + window_words]) for first in firsts], batch_size=1)
+
+    doc = next(docs)
+    begin = 0  # char the current window continues from
+    for k, first in enumerate(firsts):
+        base = offsets[first]
+        begin_token = _token_at(doc, begin - base)
+        if k == len(firsts) - 1:
+            cut, next_doc = len(doc), None
+        else:
+            next_doc = next(docs)
+            next_base = offsets[firsts[k + 1]]
+            low = max(next_base, begin)
+            high = max(low, offsets[firsts[k + 1] + overlap_words // 2])
+            shared = {token.idx + next_base for token in next_doc}
+            cut = next((
+                sent.start for sent in doc.sents
+                if low <= sent.start_char + base <= high and sent.start_char + base in shared
+            ), None)
+            if cut is None:
+                # ! No sentence starts there, e.g. a single sentence longer than the overlap, cut at a token both parses share
+                cut = next((token.i for token in doc if token.idx + base >= low and token.idx + base in shared), len(doc))
+            begin = base + (doc[cut].idx if cut < len(doc) else len(doc.text))
 
-    sentences_by_mark = [sent.text for sent in doc.sents]
+        for sent in doc.sents:
+            if sent.start >= cut:
+                break
+            if sent.end > begin_token:
+                yield doc[max(sent.start, begin_token):min(sent.end, cut)].as_doc()
+        doc = next_doc
+
+def parse_transcript(nlp):
+    """The whole transcript as one Doc, parsed window by window"""
+    words, joiner = load_words()
+    return Doc.from_docs(list(stream_sentences(nlp, words, joiner)), ensure_whitespace=False)
+
+def split_by_mark(doc):
+    """Sentence spans of the parsed transcript"""
+    assert doc.has_annotation("SENT_START")
 
-    with open("output/log/sentence_by_mark.txt", "w", encoding="utf-8") as output_file:
-        for i, sentence in enumerate(sentences_by_mark):
-            if i > 0 and sentence.strip() in [',', '.', '，', '。', '？', '！']:
-                # ! If the current line contains only punctuation, merge it with the previous line, this happens in Chinese, Japanese, etc.
-                output_file.seek(output_file.tell() - 1, os.SEEK_SET)  # Move to the end of the previous line
-                output_file.write(sentence)  # Add the punctuation
-            else:
-                output_file.write(sentence + "\n")
-    
-    print("[green]💾 Sentences split by punctuation marks saved to →  `sentences_by_mark.txt`[/green]")
+    sentences_by_mark = []
+    for sent in doc.sents:
+        if sentences_by_mark and sent.text.strip() in [',', '.', '，', '。', '？', '！']:
+            # ! If the current sentence contains only punctuation, merge it with the previous one, this happens in Chinese, Japanese, etc.
+            sentences_by_mark[-1] = doc[sentences_by_mark[-1].start:sent.end]
+        else:
+            sentences_by_mark.append(sent)
+    return sentences_by_mark
 
 if __name__ == "__main__":
     nlp = init_nlp()
-    split_by_mark(nlp)
+    for sentence in split_by_mark(parse_transcript(nlp)):
+        print(sentence.text)
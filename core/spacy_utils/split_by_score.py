@@ -0,0 +1,50 @@
+import warnings
+warnings.filterwarnings("ignore", category=FutureWarning)
+import os,sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from core.spacy_utils.load_nlp_model import init_nlp
+from rich import print
+
+CLAUSE_PUNCT = [",", "，", ";", "；", ":", "：", "、"]
+CLAUSE_DEPS = ["advcl", "ccomp", "xcomp", "conj", "relcl", "parataxis"]
+# Words that belong with the token after them, a cut right behind one breaks a phrase apart
+BOUND_TO_NEXT_DEPS = ["det", "amod", "compound", "case", "poss", "nummod", "aux", "auxpass", "prep", "neg", "advmod"]
+CONTRACTIONS = ["'s", "'re", "'ve", "'ll", "'d", "n't"]
+
+def score_split(doc, k):
+    """Score cutting `doc` (a Doc or a Span of one) right before its token k, None if the cut is not allowed.
+    Half of the score is length balance, the other half how clearly a clause boundary sits there."""
+    token, prev = doc[k], doc[k - 1]
+    if token.is_punct or token.is_space or token.text.lower() in CONTRACTIONS:
+        return None
+    if prev.dep_ in BOUND_TO_NEXT_DEPS and prev.head.i >= token.i:
+        return None
+    left_words = [t for t in doc[:k] if not t.is_punct]
+    right_words = [t for t in doc[k:] if not t.is_punct]
+    if len(left_words) < 3 or len(right_words) < 3:
+        return None
+
+    total = len(doc.text)
+    balance = 1 - abs(2 * len(doc[:k].text) - total) / total
+    if prev.text in CLAUSE_PUNCT:
+        boundary = 0.5
+    elif token.pos_ in ["CCONJ", "SCONJ"] or token.dep_ in ["cc", "mark"]:
+        boundary = 0.4
+    elif token.left_edge.i == token.i and (token.dep_ in CLAUSE_DEPS or token.head.dep_ in CLAUSE_DEPS):
+        boundary = 0.3
+    else:
+        boundary = 0
+    return 0.5 * balance + boundary
+
+def find_rule_split(doc):
+    """Return the best split as ("left || right", score), or None if the parse offers no allowed cut"""
+    scored = [(score, k) for k in range(1, len(doc)) for score in [score_split(doc, k)] if score is not None]
+    if not scored:
+        return None
+    score, k = max(scored)
+    return f"{doc[:k].text.strip()} || {doc[k:].text.strip()}", score
+
+if __name__ == "__main__":
+    nlp = init_nlp()
+    test = "I wanted to go to the store yesterday because we ran out of milk and the kids were asking for cereal."
+    print(find_rule_split(nlp(test)))
@@ -3,6 +3,7 @@ import sys
 import time
 import shutil
 import subprocess
+import contextvars
 from typing import Tuple
 
 import pandas as pd
@@ -13,8 +14,8 @@ from rich.progress import Progress
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.config_utils import load_key
-from core.all_whisper_methods.whisperX_utils import get_audio_duration
+from core.config_utils import load_key, pinned_config
+from core.media_probe import get_audio_duration
 from core.all_tts_functions.tts_main import tts_main
 
 console = Console()
@@ -103,7 +104,7 @@ def generate_tts_audio(tasks_df: pd.DataFrame) -> pd.DataFrame:
             remaining_tasks = tasks_df.iloc[warmup_size:].copy()
             with ThreadPoolExecutor() as executor:
                 futures = [
-                    executor.submit(process_row, row, tasks_df.copy())
+                    executor.submit(contextvars.copy_context().run, process_row, row, tasks_df.copy())
                     for _, row in remaining_tasks.iterrows()
                 ]
                 
@@ -189,6 +190,7 @@ def merge_chunks(tasks_df: pd.DataFrame) -> pd.DataFrame:
     rprint("[bold green]✅ Audio chunks processing completed![/bold green]")
     return tasks_df
 
+@pinned_config()
 def gen_audio() -> None:
     """Main function: Generate audio and process timeline"""
     rprint("[bold magenta]🚀 Starting audio generation process...[/bold magenta]")
@@ -7,22 +7,28 @@ warnings.filterwarnings("ignore")
 import whisperx
 import torch
 from typing import Dict
-import librosa
 from rich import print as rprint
 import subprocess
-import tempfile
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 from core.config_utils import load_key
 from core.all_whisper_methods.demucs_vl import demucs_main, RAW_AUDIO_FILE, VOCAL_AUDIO_FILE
-from core.all_whisper_methods.whisperX_utils import process_transcription, convert_video_to_audio, split_audio, save_results, save_language, compress_audio, CLEANED_CHUNKS_EXCEL_PATH
+from core.all_whisper_methods.whisperX_utils import process_transcription, convert_video_to_audio, split_audio, save_results, save_language, CLEANED_CHUNKS_EXCEL_PATH
+from core.all_whisper_methods.pcm_audio import open_pcm, PcmAudio
 from core.step1_ytdlp import find_video_files
 
 MODEL_DIR = load_key("model_dir")
-WHISPER_FILE = "output/audio/for_whisper.m4a"
+WHISPER_SAMPLE_RATE = 16000
+
+_MIRROR = None
 
 def check_hf_mirror() -> str:
-    """Check and return the fastest HF mirror"""
+    """Check and return the fastest HF mirror, probed once per process"""
+    global _MIRROR
+    if _MIRROR is not None:
+        return _MIRROR
     mirrors = {
         'Official': 'huggingface.co',
         'Mirror': 'hf-mirror.com'
@@ -49,108 +55,148 @@ def check_hf_mirror() -> str:
     if best_time == float('inf'):
         rprint("[yellow]⚠️ All mirrors failed, using default[/yellow]")
     rprint(f"[cyan]🚀 Selected mirror:[/cyan] {fastest_url} ({best_time:.2f}s)")
+    _MIRROR = fastest_url
     return fastest_url
 
-def transcribe_audio(audio_file: str, start: float, end: float) -> Dict:
-    os.environ['HF_ENDPOINT'] = check_hf_mirror() #? don't know if it's working...
-    WHISPER_LANGUAGE = load_key("whisper.language")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    rprint(f"🚀 Starting WhisperX using device: {device} ...")
-    
-    if device == "cuda":
-        gpu_mem = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-        batch_size = 16 if gpu_mem > 8 else 2
-        compute_type = "float16" if torch.cuda.is_bf16_supported() else "int8"
-        rprint(f"[cyan]🎮 GPU memory:[/cyan] {gpu_mem:.2f} GB, [cyan]📦 Batch size:[/cyan] {batch_size}, [cyan]⚙️ Compute type:[/cyan] {compute_type}")
-    else:
-        batch_size = 1
-        compute_type = "int8"
-        rprint(f"[cyan]📦 Batch size:[/cyan] {batch_size}, [cyan]⚙️ Compute type:[/cyan] {compute_type}")
-    rprint(f"[green]▶️ Starting WhisperX for segment {start:.2f}s to {end:.2f}s...[/green]")
-    
-    try:
-        if WHISPER_LANGUAGE == 'zh':
-            model_name = "Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper"
-            local_model = os.path.join(MODEL_DIR, "Belle-whisper-large-v3-zh-punct-fasterwhisper")
+class WhisperSession:
+    """Owns the ASR model (with its VAD) and the alignment models for one transcription job.
+    Models are loaded on first use and kept until `close`, so every audio segment reuses them.
+    `cpu_threads` pins the CTranslate2 and torch thread counts, e.g. for one worker of the CPU pool."""
+    def __init__(self, cpu_threads: int = None):
+        os.environ['HF_ENDPOINT'] = check_hf_mirror() #? don't know if it's working...
+        self.cpu_threads = cpu_threads
+        if cpu_threads:
+            torch.set_num_threads(cpu_threads)  # alignment and VAD run on torch
+        self.language = load_key("whisper.language")
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        rprint(f"🚀 Starting WhisperX using device: {self.device} ...")
+        
+        if self.device == "cuda":
+            gpu_mem = torch.cuda.get_device_properties(0).total_memory / (1024**3)
+            self.batch_size = 16 if gpu_mem > 8 else 2
+            self.compute_type = "float16" if torch.cuda.is_bf16_supported() else "int8"
+            rprint(f"[cyan]🎮 GPU memory:[/cyan] {gpu_mem:.2f} GB, [cyan]📦 Batch size:[/cyan] {self.batch_size}, [cyan]⚙️ Compute type:[/cyan] {self.compute_type}")
         else:
-            model_name = load_key("whisper.model")
-            local_model = os.path.join(MODEL_DIR, model_name)
+            self.batch_size = 1
+            self.compute_type = "int8"
+            rprint(f"[cyan]📦 Batch size:[/cyan] {self.batch_size}, [cyan]⚙️ Compute type:[/cyan] {self.compute_type}")
+        self.align_batch_size = load_key("whisper_align_batch_size")
+        self.model = None
+        self.align_models = {}  # language code -> (model, metadata)
+
+    def _get_model(self):
+        if self.model is None:
+            if self.language == 'zh':
+                model_name = "Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper"
+                local_model = os.path.join(MODEL_DIR, "Belle-whisper-large-v3-zh-punct-fasterwhisper")
+            else:
+                model_name = load_key("whisper.model")
+                local_model = os.path.join(MODEL_DIR, model_name)
+                
+            if os.path.exists(local_model):
+                rprint(f"[green]📥 Loading local WHISPER model:[/green] {local_model} ...")
+                model_name = local_model
+            else:
+                rprint(f"[green]📥 Using WHISPER model from HuggingFace:[/green] {model_name} ...")
+
+            vad_options = {"vad_onset": 0.500,"vad_offset": 0.363}
+            asr_options = {"temperatures": [0],"initial_prompt": "",}
+            whisper_language = None if 'auto' in self.language else self.language
+            rprint("[bold yellow]**You can ignore warning of `Model was trained with torch 1.10.0+cu102, yours is 2.0.0+cu118...`**[/bold yellow]")
+            thread_options = {"threads": self.cpu_threads} if self.cpu_threads else {}
+            self.model = whisperx.load_model(model_name, self.device, compute_type=self.compute_type, language=whisper_language, vad_options=vad_options, asr_options=asr_options, download_root=MODEL_DIR, **thread_options)
+        return self.model
+
+    def _get_align_model(self, language_code: str):
+        if language_code not in self.align_models:
+            self.align_models[language_code] = whisperx.load_align_model(language_code=language_code, device=self.device)
+        return self.align_models[language_code]
+
+    def transcribe_segment(self, audio: PcmAudio, start: float, end: float, print_progress: bool = True) -> Dict:
+        """Transcribe and align `start`-`end` seconds of 16 kHz mono float32 `audio`.
+        The detected language is returned under 'language', the caller saves it."""
+        rprint(f"[green]▶️ Starting WhisperX for segment {start:.2f}s to {end:.2f}s...[/green]")
+        try:
+            audio_segment = audio.slice(start, end)  # a view of the mapped PCM, nothing is decoded again
             
-        if os.path.exists(local_model):
-            rprint(f"[green]📥 Loading local WHISPER model:[/green] {local_model} ...")
-            model_name = local_model
-        else:
-            rprint(f"[green]📥 Using WHISPER model from HuggingFace:[/green] {model_name} ...")
-
-        vad_options = {"vad_onset": 0.500,"vad_offset": 0.363}
-        asr_options = {"temperatures": [0],"initial_prompt": "",}
-        whisper_language = None if 'auto' in WHISPER_LANGUAGE else WHISPER_LANGUAGE
-        rprint("[bold yellow]**You can ignore warning of `Model was trained with torch 1.10.0+cu102, yours is 2.0.0+cu118...`**[/bold yellow]")
-        model = whisperx.load_model(model_name, device, compute_type=compute_type, language=whisper_language, vad_options=vad_options, asr_options=asr_options, download_root=MODEL_DIR)
-
-        # Create temporary file to store audio segment
-        temp_audio_path = f"{audio_file}_temp_{start}_{end}.m4a"
-        # Use ffmpeg to cut audio
-        ffmpeg_cmd = [
-            'ffmpeg', '-y',
-            '-i', audio_file,
-            '-ss', str(start),
-            '-t', str(end-start),
-            '-vn',
-            '-c:a', 'aac',           # 使用 AAC 编码器
-            '-ar', '16000',          # 采样率
-            '-ac', '1',              # 单声道
-            '-b:a', '32k',           # 比特率
-            temp_audio_path
-        ]
-        subprocess.run(ffmpeg_cmd, check=True, capture_output=True)
-        
-        # 使用 pydub 加载音频
-        from pydub import AudioSegment
-        audio = AudioSegment.from_file(temp_audio_path, format="m4a")
-        # 转换为 numpy array
-        import numpy as np
-        audio_segment = np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
-        sample_rate = audio.frame_rate
-        
-        # 删除临时文件
-        os.unlink(temp_audio_path)
-        
-        rprint("[bold green]note: You will see Progress if working correctly[/bold green]")
-        result = model.transcribe(audio_segment, batch_size=batch_size, print_progress=True)
+            if print_progress:
+                rprint("[bold green]note: You will see Progress if working correctly[/bold green]")
+            result = self._get_model().transcribe(audio_segment, batch_size=self.batch_size, print_progress=print_progress)
+
+            language = result['language']
+            if language == 'zh' and self.language != 'zh':
+                raise ValueError("请指定转录语言为 zh 后重试！")
+
+            # Align whisper output
+            model_a, metadata = self._get_align_model(language)
+            result = whisperx.align(result["segments"], model_a, metadata, audio_segment, self.device, return_char_alignments=False, batch_size=self.align_batch_size)
+            result['language'] = language
+
+            # Adjust timestamps
+            for segment in result['segments']:
+                segment['start'] += start
+                segment['end'] += start
+                for word in segment['words']:
+                    if 'start' in word:
+                        word['start'] += start
+                    if 'end' in word:
+                        word['end'] += start
+            return result
+        except Exception as e:
+            rprint(f"[red]WhisperX processing error:[/red] {e}")
+            raise
 
+    def close(self):
         # Free GPU resources
-        del model
-        torch.cuda.empty_cache()
-
-        # Save language
-        save_language(result['language'])
-        if result['language'] == 'zh' and WHISPER_LANGUAGE != 'zh':
-            raise ValueError("请指定转录语言为 zh 后重试！")
-
-        # Align whisper output
-        model_a, metadata = whisperx.load_align_model(language_code=result["language"], device=device)
-        result = whisperx.align(result["segments"], model_a, metadata, audio_segment, device, return_char_alignments=False)
-
-        # Free GPU resources again
-        torch.cuda.empty_cache()
-        del model_a
-
-        # Adjust timestamps
-        for segment in result['segments']:
-            segment['start'] += start
-            segment['end'] += start
-            for word in segment['words']:
-                if 'start' in word:
-                    word['start'] += start
-                if 'end' in word:
-                    word['end'] += start
-        return result
-    except Exception as e:
-        rprint(f"[red]WhisperX processing error:[/red] {e}")
-        if os.path.exists(temp_audio_path):
-            os.unlink(temp_audio_path)
-        raise
+        self.model = None
+        self.align_models.clear()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ------------
+# CPU pool: one WhisperSession per worker process, each with a pinned thread budget
+# ------------
+
+_WORKER = {}
+
+def _init_worker(mirror: str, cpu_threads: int, pcm_path: str):
+    global _MIRROR
+    _MIRROR = mirror  # already probed by the parent
+    _WORKER['session'] = WhisperSession(cpu_threads=cpu_threads)
+    _WORKER['audio'] = PcmAudio(pcm_path)  # maps the parent's PCM file, nothing is decoded or copied
+
+def _transcribe_in_worker(start: float, end: float) -> Dict:
+    return _WORKER['session'].transcribe_segment(_WORKER['audio'], start, end, print_progress=False)
+
+def pool_workers() -> int:
+    """Worker processes for CPU transcription, 0 when segments should be transcribed one after another"""
+    if torch.cuda.is_available():
+        return 0
+    workers = load_key("whisper_cpu_pool.workers")
+    if workers == -1:
+        workers = max(1, (os.cpu_count() or 1) // load_key("whisper_cpu_pool.cpu_threads"))
+    return workers
+
+def transcribe_parallel(audio: PcmAudio, segments: list, workers: int) -> list:
+    """Transcribe `segments` of `audio` in `workers` processes, results in segment order"""
+    cpu_threads = load_key("whisper_cpu_pool.cpu_threads")
+    workers = min(workers, len(segments))
+    rprint(f"[cyan]🧵 Transcribing {len(segments)} segments in {workers} processes × {cpu_threads} threads ...[/cyan]")
+    # spawn: forking a process that already runs torch threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(check_hf_mirror(), cpu_threads, audio.path)) as pool:
+        futures = [pool.submit(_transcribe_in_worker, start, end) for start, end in segments]
+        results = []
+        for i, future in enumerate(futures, 1):
+            results.append(future.result())
+            rprint(f"[green]✅ Segment {i}/{len(segments)} transcribed[/green]")
+    return results
 
 def transcribe():
     if os.path.exists(CLEANED_CHUNKS_EXCEL_PATH):
@@ -165,18 +211,29 @@ def transcribe():
     if load_key("demucs"):
         demucs_main()
     
-    # step2 Compress audio
+    # step2 Decode audio once to 16 kHz mono PCM, every segment below is a view of it
     choose_audio = VOCAL_AUDIO_FILE if load_key("demucs") else RAW_AUDIO_FILE
-    whisper_audio = compress_audio(choose_audio, WHISPER_FILE)
+    whisper_audio = open_pcm(choose_audio, WHISPER_SAMPLE_RATE, 1)
 
-    # step3 Extract audio
-    segments = split_audio(whisper_audio)
+    # step3 Extract audio, shorter segments when a CPU pool transcribes them side by side
+    workers = pool_workers()
+    if workers:
+        segment_len = load_key("whisper_cpu_pool.segment_len")
+        segments = split_audio(whisper_audio, target_len=segment_len, win=min(60, segment_len // 5))
+    else:
+        segments = split_audio(whisper_audio)
     
     # step4 Transcribe audio
-    all_results = []
-    for start, end in segments:
-        result = transcribe_audio(whisper_audio, start, end)
-        all_results.append(result)
+    if workers:
+        all_results = transcribe_parallel(whisper_audio, segments, workers)
+    else:
+        all_results = []
+        # Models are loaded once for the whole job, not per segment
+        with WhisperSession() as session:
+            for start, end in segments:
+                all_results.append(session.transcribe_segment(whisper_audio, start, end))
+    if all_results:
+        save_language(all_results[-1]['language'])
     
     # step5 Combine results
     combined_result = {'segments': []}
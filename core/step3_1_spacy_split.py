@@ -1,24 +1,80 @@
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import string
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spacy.tokens import DocBin
+from rich import print
 
-from spacy_utils.split_by_comma import split_by_comma_main
-from spacy_utils.split_by_connector import split_sentences_main
-from spacy_utils.split_by_mark import split_by_mark
-from spacy_utils.split_long_by_root import split_long_by_root_main
-from spacy_utils.load_nlp_model import init_nlp
+from core.spacy_utils.split_by_comma import split_by_comma
+from core.spacy_utils.split_by_connector import split_by_connectors
+from core.spacy_utils.split_by_mark import parse_transcript, split_by_mark
+from core.spacy_utils.split_long_by_root import split_by_root
+from core.spacy_utils.load_nlp_model import init_nlp, parse_pipes
+from core.config_utils import load_key, pinned_config
 
+# The parse of the whole transcript, with the token ranges of the final sentences in its user data
+SEGMENTS_FILE = 'output/log/sentence_segments.spacy'
+LOG_FOLDER = 'output/log'
+# Each stage works on the spans the previous one produced, `spacy_debug_files` dumps them as text
+STAGES = [
+    ('sentence_by_comma', split_by_comma),
+    ('sentence_splitbyconnector', split_by_connectors),
+    ('sentence_splitbynlp', split_by_root),
+]
+PUNCTUATION = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
+
+def _write_debug_file(name, spans):
+    with open(os.path.join(LOG_FOLDER, f"{name}.txt"), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(span.text.strip() for span in spans))
+
+def merge_punctuation_only(spans):
+    """Attach empty or punctuation-only pieces to the piece before them"""
+    merged = []
+    for i, span in enumerate(spans):
+        text = span.text.strip()
+        if not text or all(char in PUNCTUATION for char in text):
+            print(f"[yellow]⚠️  Warning: Empty or punctuation-only line detected at index {i}[/yellow]")
+            if merged:
+                merged[-1] = span.doc[merged[-1].start:span.end]
+            continue
+        merged.append(span)
+    return merged
+
+def segment_doc(doc, debug_files=False):
+    """Run every segmentation stage on token ranges of the one parse"""
+    spans = split_by_mark(doc)
+    if debug_files:
+        _write_debug_file('sentence_by_mark', spans)
+    for name, stage in STAGES:
+        spans = [piece for span in spans for piece in stage(span)]
+        if debug_files:
+            _write_debug_file(name, spans)
+    return merge_punctuation_only(spans)
+
+def load_segments(nlp):
+    """The final sentences as Spans of the saved parse, so later steps need not parse again"""
+    doc_bin = DocBin(store_user_data=True).from_disk(SEGMENTS_FILE)
+    doc = next(doc_bin.get_docs(nlp.vocab))
+    return [doc[start:end] for start, end in doc.user_data['segments']]
+
+@pinned_config()
 def split_by_spacy():
-    if os.path.exists('output/log/sentence_splitbynlp.txt'):
-        print("File 'sentence_splitbynlp.txt' already exists. Skipping split_by_spacy.")
+    if os.path.exists(SEGMENTS_FILE):
+        print(f"File '{os.path.basename(SEGMENTS_FILE)}' already exists. Skipping split_by_spacy.")
         return
-    
+
     nlp = init_nlp()
-    split_by_mark(nlp)
-    split_by_comma_main(nlp)
-    split_sentences_main(nlp)
-    split_long_by_root_main(nlp)
+    # 🧠 Parse the transcript once, in bounded windows; every stage below only moves token boundaries
+    with parse_pipes(nlp):
+        doc = parse_transcript(nlp)
+    spans = segment_doc(doc, debug_files=load_key("spacy_debug_files"))
+
+    doc.user_data['segments'] = [[span.start, span.end] for span in spans]
+    doc_bin = DocBin(store_user_data=True)
+    doc_bin.add(doc)
+    doc_bin.to_disk(SEGMENTS_FILE)
+    print(f"[green]💾 {len(spans)} sentences split by spaCy saved to →  `{SEGMENTS_FILE}`[/green]")
     return
 
 if __name__ == '__main__':
-    split_by_spacy()
\ No newline at end of file
+    split_by_spacy()
@@ -1,56 +1,23 @@
 import sys,os,math
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import concurrent.futures
-from core.ask_gpt import ask_gpt
-from core.prompts_storage import get_split_prompt
-from difflib import SequenceMatcher
+import asyncio
+from core.ask_gpt import ask_gpt_async
+from core.llm_engine import run_all
+from core.prompts_storage import get_split_prompt, get_batch_split_prompt
+from core.text_align import align_split_offsets
 import math
-from core.spacy_utils.load_nlp_model import init_nlp
-from core.config_utils import load_key, get_joiner
+from core.spacy_utils.load_nlp_model import init_nlp, pipe_docs, parse_pipes
+from core.step3_1_spacy_split import load_segments
+from core.spacy_utils.split_by_score import find_rule_split
+from core.config_utils import load_key, pinned_config
 from rich.console import Console
 from rich.table import Table
-import time
 
 console = Console()
+# LLM splits whose text drifted further than this from the original are rejected
+MIN_SPLIT_CONFIDENCE = 0.9
 
-def tokenize_sentence(sentence, nlp):
-    # tokenizer counts the number of words in the sentence
-    doc = nlp(sentence)
-    return [token.text for token in doc]
-
-def find_split_positions(original, modified):
-    split_positions = []
-    parts = modified.split('[br]')
-    start = 0
-    whisper_language = load_key("whisper.language")
-    language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language
-    joiner = get_joiner(language)
-
-    for i in range(len(parts) - 1):
-        max_similarity = 0
-        best_split = None
-
-        for j in range(start, len(original)):
-            original_left = original[start:j]
-            modified_left = joiner.join(parts[i].split())
-
-            left_similarity = SequenceMatcher(None, original_left, modified_left).ratio()
-
-            if left_similarity > max_similarity:
-                max_similarity = left_similarity
-                best_split = j
-
-        if max_similarity < 0.9:
-            console.print(f"[yellow]Warning: low similarity found at the best split point: {max_similarity}[/yellow]")
-        if best_split is not None:
-            split_positions.append(best_split)
-            start = best_split
-        else:
-            console.print(f"[yellow]Warning: Unable to find a suitable split point for the {i+1}th part.[/yellow]")
-
-    return split_positions
-
-def split_sentence(sentence: str, max_length: int, nlp, retry_attempt: int = 0) -> dict:
+async def split_sentence_async(sentence: str, max_length: int, nlp=None, retry_attempt: int = 0) -> dict:
     """使用 LLM 分割句子"""
     if len(sentence) <= max_length:
         return {"original": sentence, "split": sentence}
@@ -68,24 +35,27 @@ def split_sentence(sentence: str, max_length: int, nlp, retry_attempt: int = 0)
 示例输入：This is a long sentence that needs to be split into two parts with similar lengths
 示例输出：This is a long sentence || that needs to be split into two parts with similar lengths"""
 
+    def valid_split(response):
+        if recover_split(sentence, response.strip()) is None:
+            return {"status": "error", "message": "Response does not split the sentence once without changing it"}
+        return {"status": "success", "message": "Split completed"}
+
     try:
-        response = ask_gpt(prompt)
-        # 确保响应中包含 ||
-        if "||" not in response:
-            raise ValueError("Response does not contain separator")
-            
-        # 直接使用响应文本，不需要解析 JSON
+        response = await ask_gpt_async(prompt, valid_def=valid_split)
+        # 按原文重建切分，LLM 对原文的改动不会被带入
+        split = recover_split(sentence, response.strip())
+
         return {
             "original": sentence,
-            "split": response.strip()
+            "split": split
         }
         
     except Exception as e:
         if retry_attempt < 2:  # 最多重试2次
             print(f"[red]Attempt {retry_attempt + 1} failed: {str(e)}[/red]")
             print(f"[yellow]Retrying in 3 seconds...[/yellow]")
-            time.sleep(3)
-            return split_sentence(sentence, max_length, nlp, retry_attempt + 1)
+            await asyncio.sleep(3)
+            return await split_sentence_async(sentence, max_length, nlp, retry_attempt + 1)
         else:
             # 如果重试失败，使用简单的长度分割
             mid = len(sentence) // 2
@@ -94,47 +64,139 @@ def split_sentence(sentence: str, max_length: int, nlp, retry_attempt: int = 0)
                 "split": f"{sentence[:mid]} || {sentence[mid:]}"
             }
 
-def parallel_split_sentences(sentences: list, max_length: int, max_workers: int, nlp, retry_attempt: int = 0) -> list:
-    """并行处理句子分割"""
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 移除 index 参数，只传入必要的参数
-        futures = [
-            executor.submit(
-                split_sentence, 
-                sentence, 
-                max_length, 
-                nlp, 
-                retry_attempt
-            ) for sentence in sentences
-        ]
-        
-        results = []
-        for future in futures:
-            try:
-                split_result = future.result()
-                if "||" in split_result["split"]:
-                    # 如果句子被分割了，添加两个部分
-                    parts = split_result["split"].split("||")
-                    results.extend([part.strip() for part in parts])
-                else:
-                    # 如果句子没有被分割，直接添加原句
-                    results.append(split_result["split"].strip())
-            except Exception as e:
-                console.print(f"[red]Error processing sentence: {str(e)}[/red]")
-                results.append(sentences[len(results)])  # 发生错误时使用原句
-                
+def recover_split(sentence: str, split):
+    """Rebuild an LLM split as "left || right" from the original sentence, so edits the LLM made to the text are dropped.
+    None if it does not cut exactly once into two non-empty parts, or its text drifted too far"""
+    if not isinstance(split, str) or split.count("||") != 1:
+        return None
+    (offset,), confidence = align_split_offsets(sentence, split.split("||"))
+    left, right = sentence[:offset].strip(), sentence[offset:].strip()
+    if confidence < MIN_SPLIT_CONFIDENCE or not left or not right:
+        return None
+    return f"{left} || {right}"
+
+async def split_sentence_batch(sentences: list) -> list:
+    """Split several sentences with one JSON request. Items the response mangles come back as None"""
+    prompt = get_batch_split_prompt(sentences)
+    def valid_batch(response_data):
+        if not isinstance(response_data, dict):
+            return {"status": "error", "message": "Response is not a JSON object"}
+        return {"status": "success", "message": "Batch split completed"}
+    try:
+        response = await ask_gpt_async(prompt, response_json=True, valid_def=valid_batch, log_title='split_by_meaning_batch')
+    except Exception as e:
+        console.print(f"[yellow]Batch split of {len(sentences)} sentences failed, falling back to single sentences: {e}[/yellow]")
+        return [None] * len(sentences)
+    splits = [response.get(str(i + 1)) for i in range(len(sentences))]
+    return [recover_split(sentence, split) for sentence, split in zip(sentences, splits)]
+
+def new_split_stats() -> dict:
+    """Per-video counters of how long sentences were split, and how many LLM requests that took"""
+    return {"rule": 0, "llm": 0, "fallback": 0, "llm_calls": 0}
+
+def _fallback_split(sentence: str, rule_split) -> str:
+    # Out of LLM budget: take the best rule split even if it is not confident, else cut in the middle
+    if rule_split:
+        return rule_split[0]
+    mid = len(sentence) // 2
+    return f"{sentence[:mid]} || {sentence[mid:]}"
+
+def parallel_split_sentences(sentences: list, max_length: int, nlp, retry_attempt: int = 0, stats: dict = None, parsed: dict = None) -> list:
+    """One splitting pass: only sentences longer than `max_length` are split.
+    In hybrid mode confident spaCy splits are taken locally and only the ambiguous rest goes to the LLM, in batches.
+    LLM requests run concurrently on the engine loop, bounded by `llm_rate_limit`.
+    `parsed` maps sentence text to its parse, only sentences missing from it are parsed."""
+    stats = new_split_stats() if stats is None else stats
+    parsed = {} if parsed is None else parsed
+    long_indices = [i for i, sentence in enumerate(sentences) if len(sentence) > max_length]
+    if not long_indices:
+        return sentences
+    mode = load_key("split_mode")
+    confidence = load_key("split_rule_confidence")
+    budget = load_key("split_llm_budget")
+    batch_size = load_key("split_batch_size")
+
+    splits = {}
+    rule_splits = {}
+    if mode != 'llm':
+        missing = list(dict.fromkeys(sentences[i] for i in long_indices if sentences[i] not in parsed))
+        with parse_pipes(nlp):
+            parsed.update(zip(missing, pipe_docs(nlp, missing)))
+        for i in long_indices:
+            rule_splits[i] = find_rule_split(parsed[sentences[i]])
+            if rule_splits[i] and (mode == 'rule' or rule_splits[i][1] >= confidence):
+                splits[i] = rule_splits[i][0]
+                stats["rule"] += 1
+
+    def take_budget(n):
+        # split_llm_budget counts LLM requests per video, 0 means unlimited; rule mode never asks the LLM
+        if mode == 'rule':
+            return 0
+        allowed = n if not budget else max(0, min(n, budget - stats["llm_calls"]))
+        stats["llm_calls"] += allowed
+        return allowed
+
+    ambiguous = [i for i in long_indices if i not in splits]
+    batches = [ambiguous[i:i + batch_size] for i in range(0, len(ambiguous), batch_size)]
+    batches = batches[:take_budget(len(batches))]
+    batch_results = run_all([split_sentence_batch([sentences[i] for i in batch]) for batch in batches])
+    for batch, batch_result in zip(batches, batch_results):
+        for i, split in zip(batch, batch_result):
+            if split is not None:
+                splits[i] = split
+                stats["llm"] += 1
+
+    # 🔁 Only the items the batch response mangled go through the single-sentence prompt
+    mangled = [i for batch in batches for i in batch if i not in splits]
+    mangled = mangled[:take_budget(len(mangled))]
+    single_results = run_all([split_sentence_async(sentences[i], max_length, nlp, retry_attempt) for i in mangled])
+    for i, split_result in zip(mangled, single_results):
+        splits[i] = split_result["split"]
+        stats["llm"] += 1
+
+    for i in long_indices:
+        if i not in splits:
+            splits[i] = _fallback_split(sentences[i], rule_splits.get(i))
+            stats["fallback"] += 1
+
+    results = []
+    for i, sentence in enumerate(sentences):
+        if i in splits:
+            # 如果句子被分割了，添加各个部分
+            results.extend(part.strip() for part in splits[i].split("||") if part.strip())
+        else:
+            results.append(sentence)
     return results
 
+def print_split_stats(stats: dict):
+    total = stats["rule"] + stats["llm"] + stats["fallback"]
+    table = Table(title="✂️ Split by meaning")
+    table.add_column("Path", style="cyan")
+    table.add_column("Splits", style="magenta")
+    table.add_column("Rate", style="green")
+    for path, label in [("rule", "spaCy rules"), ("llm", "LLM"), ("fallback", "Fallback (over budget)")]:
+        table.add_row(label, str(stats[path]), f"{stats[path] / total:.0%}" if total else "-")
+    table.add_row("LLM requests", str(stats["llm_calls"]), "")
+    console.print(table)
+
+@pinned_config()
 def split_sentences_by_meaning():
     """The main function to split sentences by meaning."""
     # read input sentences
-    with open('output/log/sentence_splitbynlp.txt', 'r', encoding='utf-8') as f:
-        sentences = [line.strip() for line in f.readlines()]
-
     nlp = init_nlp()
-    # 🔄 process sentences multiple times to ensure all are split
+    # ♻️ Sentences come as spans of the parse step3_1 saved, rule splitting reuses them as they are
+    spans = load_segments(nlp)
+    sentences = [span.text.strip() for span in spans]
+    parsed = dict(zip(sentences, spans))
+
+    # 🔄 process sentences multiple times to ensure all are split, each pass only re-queues parts that are still too long
+    max_length = load_key("max_split_length")
+    stats = new_split_stats()
     for retry_attempt in range(3):
-        sentences = parallel_split_sentences(sentences, max_length=load_key("max_split_length"), max_workers=load_key("max_workers"), nlp=nlp, retry_attempt=retry_attempt)
+        if all(len(sentence) <= max_length for sentence in sentences):
+            break
+        sentences = parallel_split_sentences(sentences, max_length=max_length, nlp=nlp, retry_attempt=retry_attempt, stats=stats, parsed=parsed)
+    print_split_stats(stats)
 
     # 💾 save results
     with open('output/log/sentence_splitbymeaning.txt', 'w', encoding='utf-8') as f:
@@ -142,5 +204,4 @@ def split_sentences_by_meaning():
     console.print('[green]✅ All sentences have been successfully split![/green]')
 
 if __name__ == '__main__':
-    # print(split_sentence('Which makes no sense to the... average guy who always pushes the character creation slider all the way to the right.', 2, 22))
     split_sentences_by_meaning()
\ No newline at end of file
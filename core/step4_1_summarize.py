@@ -2,6 +2,8 @@ import os, sys, json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.ask_gpt import ask_gpt
 from core.prompts_storage import get_summary_prompt
+from core.term_matcher import load_term_index
+from core.config_utils import pinned_config
 
 TERMINOLOGY_JSON_PATH = 'output/log/terminology.json'
 SENTENCE_TXT_PATH = 'output/log/sentence_splitbymeaning.txt'
@@ -14,22 +16,20 @@ def combine_chunks():
     combined_text = ' '.join(cleaned_sentences)
     return combined_text[:32000]  #! Return only the first 32000 characters
 
-def search_things_to_note_in_prompt(sentence):
-    """Search for terms to note in the given sentence"""
-    with open(TERMINOLOGY_JSON_PATH, 'r', encoding='utf-8') as file:
-        things_to_note = json.load(file)
-    things_to_note_list = [term['src'] for term in things_to_note['terms'] if term['src'].lower() in sentence.lower()]
-    if things_to_note_list:
-        prompt = '\n'.join(
-            f'{i+1}. "{term["src"]}": "{term["tgt"]}",'
-            f' meaning: {term["note"]}'
-            for i, term in enumerate(things_to_note['terms'])
-            if term['src'] in things_to_note_list
-        )
-        return prompt
-    else:
+def match_terms(sentence):
+    """Return the terminology records whose source term appears in the given sentence"""
+    return load_term_index(TERMINOLOGY_JSON_PATH).match(sentence)
+
+def build_things_to_note_prompt(terms):
+    if not terms:
         return None
+    return '\n'.join(
+        f'{i+1}. "{term["src"]}": "{term["tgt"]}",'
+        f' meaning: {term["note"]}'
+        for i, term in enumerate(terms)
+    )
 
+@pinned_config()
 def get_summary():
     src_content = combine_chunks()
     summary_prompt = get_summary_prompt(src_content)
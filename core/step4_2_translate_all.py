@@ -2,16 +2,20 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 import json
-import concurrent.futures
-from core.translate_once import translate_lines
-from core.step4_1_summarize import search_things_to_note_in_prompt
-from core.step8_1_gen_audio_task import check_len_then_trim
+import hashlib
+import asyncio
+from core.translate_once import translate_lines_async
+from core.llm_engine import run_all
+from core.step4_1_summarize import match_terms, build_things_to_note_prompt
+from core.step8_1_gen_audio_task import trim_subtitles
 from core.step6_generate_final_timeline import align_timestamp
-from core.config_utils import load_key
+from core.config_utils import load_key, pinned_config
+from core.translation_memory import lookup as lookup_memory, remember as remember_memory
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
 from rich.progress import Progress, SpinnerColumn, TextColumn
-from difflib import SequenceMatcher
+from core.text_align import similarity
 
 console = Console()
 
@@ -19,6 +23,8 @@ SENTENCE_SPLIT_FILE = "output/log/sentence_splitbymeaning.txt"
 TRANSLATION_RESULTS_FILE = "output/log/translation_results.xlsx"
 TERMINOLOGY_FILE = "output/log/terminology.json"
 CLEANED_CHUNKS_FILE = "output/log/cleaned_chunks.xlsx"
+CHECKPOINT_FILE = "output/log/translation_checkpoint.jsonl"
+MATCH_WINDOW = 3  # how many neighbouring results the fuzzy fallback may look at on each side
 
 # Function to split text into chunks
 def split_chunks_by_chars(chunk_size=400, max_i=8): 
@@ -46,23 +52,117 @@ def get_previous_content(chunks, chunk_index):
 def get_after_content(chunks, chunk_index):
     return None if chunk_index == len(chunks) - 1 else chunks[chunk_index + 1].split('\n')[:2] # Get first 2 lines
 
-# 🔍 Translate a single chunk
-def translate_chunk(chunk, chunks, theme_prompt, i):
-    things_to_note_prompt = search_things_to_note_in_prompt(chunk)
+# 🔍 Collect everything the prompt of a chunk depends on besides the chunk itself
+def get_chunk_inputs(chunk, chunks, i):
+    terms = match_terms(chunk)
     previous_content_prompt = get_previous_content(chunks, i)
     after_content_prompt = get_after_content(chunks, i)
-    translation, english_result = translate_lines(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i)
+    return terms, previous_content_prompt, after_content_prompt
+
+def build_reference_prompt(references):
+    """Translation memory hits, shown to the LLM as references only"""
+    if not references:
+        return None
+    return 'Reference translations of similar sentences from earlier videos, the wording, numbers or negation may differ from the current line, so adapt them and keep the terms above:\n' + '\n'.join(
+        f'- "{src}": "{tgt}"' for src, tgt in references
+    )
+
+# 🔍 Translate a single chunk
+async def translate_chunk(chunk, chunk_inputs, theme_prompt, i, references=None):
+    terms, previous_content_prompt, after_content_prompt = chunk_inputs
+    things_to_note_prompt = '\n\n'.join(filter(None, [build_things_to_note_prompt(terms), build_reference_prompt(references)])) or None
+    translation, english_result = await translate_lines_async(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i)
     return i, english_result, translation
 
-# Add similarity calculation function
-def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
+# 💾 Per-chunk checkpoint, so a failed run or a terminology edit only redoes the chunks whose prompt inputs changed
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+def chunk_fingerprint(chunk, chunk_inputs, theme_prompt):
+    terms, previous_content_prompt, after_content_prompt = chunk_inputs
+    return {
+        'src': _digest(chunk),
+        'terms': _digest(sorted([term['src'], term['tgt'], term['note']] for term in terms)),
+        'context': _digest([previous_content_prompt, after_content_prompt, theme_prompt, load_key("target_language")]),
+    }
+
+def load_checkpoint():
+    checkpoint = {}
+    if os.path.exists(CHECKPOINT_FILE):
+        with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line after a crash
+                if 'fingerprint' in record:
+                    checkpoint[record['key']] = record
+    return checkpoint
+
+def save_checkpoint(f, fingerprint, src, translation):
+    record = {'key': _digest(fingerprint), 'fingerprint': fingerprint, 'src': src, 'translation': translation}
+    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+def plan_translation(fingerprints, checkpoint):
+    """Classify each chunk as restored from the checkpoint or needing translation, and why"""
+    last_seen = {record['fingerprint']['src']: record['fingerprint'] for record in checkpoint.values()}
+    plan = []
+    for fingerprint in fingerprints:
+        previous = last_seen.get(fingerprint['src'])
+        if _digest(fingerprint) in checkpoint:
+            plan.append('restored')
+        elif previous is None:
+            plan.append('new')
+        elif previous['terms'] != fingerprint['terms']:
+            plan.append('terminology')
+        else:
+            plan.append('context')
+    return plan
+
+def print_translation_plan(plan):
+    table = Table(title="🧮 Translation plan")
+    table.add_column("Chunks", style="cyan")
+    table.add_column("Count", style="magenta")
+    for reason, label in [('restored', 'Restored from checkpoint'), ('memory', 'From translation memory'), ('new', 'New'), ('terminology', 'Terminology changed'), ('context', 'Context or theme changed')]:
+        table.add_row(label, str(plan.count(reason)))
+    todo = len(plan) - plan.count('restored') - plan.count('memory')
+    # faithfulness + expressiveness per chunk, subtitle trimming comes on top
+    table.add_row("LLM calls (translation)", str(2 * todo))
+    console.print(table)
+
+def _normalize_chunk(text):
+    return ''.join(text.split('\n')).lower()
+
+def chunk_checksum(text):
+    return hashlib.md5(_normalize_chunk(text).encode('utf-8')).hexdigest()
+
+def match_chunk_result(chunk, i, results_by_index):
+    """Take the result carrying index `i`, only fall back to fuzzy matching nearby results if its source differs"""
+    result = results_by_index.get(i)
+    if result is not None and chunk_checksum(result[1]) == chunk_checksum(chunk):
+        return result
+
+    chunk_text = _normalize_chunk(chunk)
+    candidates = [results_by_index[j] for j in range(i - MATCH_WINDOW, i + MATCH_WINDOW + 1) if j in results_by_index]
+    matching_results = [(r, similarity(_normalize_chunk(r[1]), chunk_text)) for r in candidates]
+    best_match = max(matching_results, key=lambda x: x[1], default=(None, 0))
+
+    # Check similarity and handle exceptions
+    if best_match[1] < 0.9:
+        console.print(f"[yellow]Warning: No matching translation found for chunk {i}[/yellow]")
+        raise ValueError(f"Translation matching failed (chunk {i})")
+    elif best_match[1] < 1.0:
+        console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {best_match[1]:.3f})[/yellow]")
+    return best_match[0]
 
 # 🚀 Main function to translate all chunks
-def translate_all():
+@pinned_config()
+def translate_all(dry_run=False):
     # Check if the file exists
-    if os.path.exists(TRANSLATION_RESULTS_FILE):
-        console.print(Panel("🚨 File `translation_results.xlsx` already exists, skipping TRANSLATE ALL.", title="Warning", border_style="yellow"))
+    if os.path.exists(TRANSLATION_RESULTS_FILE) and not dry_run:
+        console.print(Panel("🚨 File `translation_results.xlsx` already exists, skipping TRANSLATE ALL.\nDelete it to retranslate, only chunks whose inputs changed are sent again (`python core/step4_2_translate_all.py --dry-run` shows how many).", title="Warning", border_style="yellow"))
         return
     
     console.print("[bold green]Start Translating All...[/bold green]")
@@ -70,46 +170,74 @@ def translate_all():
     with open(TERMINOLOGY_FILE, 'r', encoding='utf-8') as file:
         theme_prompt = json.load(file).get('theme')
 
-    # 🔄 Use concurrent execution for translation
+    # ♻️ Restore chunks whose prompt inputs are unchanged from the checkpoint
+    chunk_inputs = [get_chunk_inputs(chunk, chunks, i) for i, chunk in enumerate(chunks)]
+    fingerprints = [chunk_fingerprint(chunk, inputs, theme_prompt) for chunk, inputs in zip(chunks, chunk_inputs)]
+    checkpoint = load_checkpoint()
+    plan = plan_translation(fingerprints, checkpoint)
+    results = [(i, checkpoint[_digest(fp)]['src'], checkpoint[_digest(fp)]['translation']) for i, (fp, state) in enumerate(zip(fingerprints, plan)) if state == 'restored']
+
+    # 📚 New chunks whose every line is an exact hit in the cross-video translation memory skip the LLM,
+    # unless this video's terminology applies to them. Other hits only go into the prompt as references.
+    # Chunks that changed because of a terminology or context edit always go back to the LLM.
+    target_language = load_key("target_language")
+    remembered, references = {}, {}
+    for i, state in enumerate(plan):
+        if state == 'new':
+            hits = [lookup_memory(line, target_language, read_only=dry_run) for line in chunks[i].split('\n')]
+            terms = chunk_inputs[i][0]
+            if not terms and all(hit is not None and hit[2] for hit in hits):
+                remembered[i] = '\n'.join(hit[1] for hit in hits)
+                plan[i] = 'memory'
+            else:
+                references[i] = [(hit[0], hit[1]) for hit in hits if hit is not None]
+    print_translation_plan(plan)
+    if dry_run:
+        return
+    todo = [i for i, state in enumerate(plan) if state not in ('restored', 'memory')]
+
+    # 🔄 Every chunk is a coroutine on the LLM engine loop, `llm_rate_limit` bounds how many are in flight
+    failed = []
     with Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
         transient=True,
     ) as progress:
-        task = progress.add_task("[cyan]Translating chunks...", total=len(chunks))
-        with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-            futures = []
-            for i, chunk in enumerate(chunks):
-                future = executor.submit(translate_chunk, chunk, chunks, theme_prompt, i)
-                futures.append(future)
-
-            results = []
-            for future in concurrent.futures.as_completed(futures):
-                results.append(future.result())
+        task = progress.add_task("[cyan]Translating chunks...", total=len(todo))
+        with open(CHECKPOINT_FILE, 'a', encoding='utf-8') as checkpoint_file:
+            for i, translation in remembered.items():
+                save_checkpoint(checkpoint_file, fingerprints[i], chunks[i], translation)
+                results.append((i, chunks[i], translation))
+
+            def keep_result(i, result):
+                save_checkpoint(checkpoint_file, fingerprints[i], result[1], result[2])
+                remember_memory(list(zip(result[1].split('\n'), result[2].split('\n'))), target_language)
+
+            async def run_chunk(i):
+                # Nothing may escape: run_all would return while other chunks still write to the checkpoint file
+                try:
+                    result = await translate_chunk(chunks[i], chunk_inputs[i], theme_prompt, i, references.get(i))
+                    # the checkpoint fsync and the memory write block, keep them off the loop
+                    await asyncio.to_thread(keep_result, i, result)
+                except Exception as e:
+                    console.print(f"[red]❌ Chunk {i} failed: {e}[/red]")
+                    failed.append(i)
+                    return
+                results.append(result)
                 progress.update(task, advance=1)
 
-    results.sort(key=lambda x: x[0])  # Sort results based on original order
+            run_all([run_chunk(i) for i in todo])
+
+    if failed:
+        raise ValueError(f"Translation of chunks {sorted(failed)} failed, finished chunks are saved in `{CHECKPOINT_FILE}`, rerun to resume")
+
+    results_by_index = {r[0]: r for r in results}
     
     # 💾 Save results to lists and Excel file
     src_text, trans_text = [], []
     for i, chunk in enumerate(chunks):
-        chunk_lines = chunk.split('\n')
-        src_text.extend(chunk_lines)
-        
-        # Calculate similarity between current chunk and translation results
-        chunk_text = ''.join(chunk_lines).lower()
-        matching_results = [(r, similar(''.join(r[1].split('\n')).lower(), chunk_text)) 
-                          for r in results]
-        best_match = max(matching_results, key=lambda x: x[1])
-        
-        # Check similarity and handle exceptions
-        if best_match[1] < 0.9:
-            console.print(f"[yellow]Warning: No matching translation found for chunk {i}[/yellow]")
-            raise ValueError(f"Translation matching failed (chunk {i})")
-        elif best_match[1] < 1.0:
-            console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {best_match[1]:.3f})[/yellow]")
-            
-        trans_text.extend(best_match[0][2].split('\n'))
+        src_text.extend(chunk.split('\n'))
+        trans_text.extend(match_chunk_result(chunk, i, results_by_index)[2].split('\n'))
     
     # Trim long translation text
     df_text = pd.read_excel(CLEANED_CHUNKS_FILE)
@@ -118,12 +246,13 @@ def translate_all():
     subtitle_output_configs = [('trans_subs_for_audio.srt', ['Translation'])]
     df_time = align_timestamp(df_text, df_translate, subtitle_output_configs, output_dir=None, for_display=False)
     console.print(df_time)
-    # apply check_len_then_trim to df_time['Translation'], only when duration > MIN_TRIM_DURATION.
-    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration']) if x['duration'] > load_key("min_trim_duration") else x['Translation'], axis=1)
+    # trim df_time['Translation'] that reads too long, only when duration > MIN_TRIM_DURATION.
+    to_trim = df_time['duration'] > load_key("min_trim_duration")
+    df_time.loc[to_trim, 'Translation'] = trim_subtitles(df_time.loc[to_trim, 'Translation'].tolist(), df_time.loc[to_trim, 'duration'].tolist())
     console.print(df_time)
     
     df_time.to_excel(TRANSLATION_RESULTS_FILE, index=False)
     console.print("[bold green]✅ Translation completed and results saved.[/bold green]")
 
 if __name__ == '__main__':
-    translate_all()
\ No newline at end of file
+    translate_all(dry_run='--dry-run' in sys.argv)
\ No newline at end of file
@@ -1,13 +1,13 @@
 import sys, os
 import pandas as pd
 from typing import List, Tuple
-import concurrent.futures
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.step3_2_splitbymeaning import split_sentence
-from core.ask_gpt import ask_gpt
+from core.step3_2_splitbymeaning import split_sentence_async
+from core.ask_gpt import ask_gpt_async
+from core.llm_engine import run_all
 from core.prompts_storage import get_align_prompt
-from core.config_utils import load_key, get_joiner
+from core.config_utils import load_key, get_joiner, pinned_config
 from rich.panel import Panel
 from rich.console import Console
 from rich.table import Table
@@ -38,7 +38,7 @@ def calc_len(text: str) -> float:
 
     return sum(char_weight(char) for char in text)
 
-def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
+async def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
     align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
     
     def valid_align(response_data):
@@ -46,7 +46,7 @@ def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], Lis
             return {"status": "error", "message": "Missing required key: `align`"}
         return {"status": "success", "message": "Align completed"}
 
-    parsed = ask_gpt(align_prompt, response_json=True, valid_def=valid_align, log_title='align_subs')
+    parsed = await ask_gpt_async(align_prompt, response_json=True, valid_def=valid_align, log_title='align_subs')
     
     align_data = parsed['align']
     src_parts = src_part.split('\n')
@@ -85,15 +85,19 @@ def split_align_subs(src_lines: List[str], tr_lines: List[str]) -> Tuple[List[st
             table.add_row("Target Line", tr)
             console.print(table)
     
-    def process(i):
-        split_src = split_sentence(src_lines[i], num_parts=2).strip()
-        src_parts, tr_parts, tr_remerged = align_subs(src_lines[i], tr_lines[i], split_src)
+    async def process(i):
+        # max_length 0: always cut into two parts, one per line
+        split = (await split_sentence_async(src_lines[i], max_length=0))["split"]
+        split_src = '\n'.join(part.strip() for part in split.split('||'))
+        src_parts, tr_parts, tr_remerged = await align_subs(src_lines[i], tr_lines[i], split_src)
         src_lines[i] = src_parts
         tr_lines[i] = tr_parts
         remerged_tr_lines[i] = tr_remerged
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-        executor.map(process, to_split)
+    # All lines are aligned concurrently on the LLM engine loop, a line that fails stays as it is
+    for i, result in zip(to_split, run_all([process(i) for i in to_split], return_exceptions=True)):
+        if isinstance(result, Exception):
+            console.print(f"[yellow]⚠️ Line {i} could not be split and aligned, kept as it is: {result}[/yellow]")
     
     # Flatten `src_lines` and `tr_lines`
     src_lines = [item for sublist in src_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
@@ -101,6 +105,7 @@ def split_align_subs(src_lines: List[str], tr_lines: List[str]) -> Tuple[List[st
     
     return src_lines, tr_lines, remerged_tr_lines
 
+@pinned_config()
 def split_for_sub_main():
     console.print("[bold green]🚀 Start splitting subtitles...[/bold green]")
     
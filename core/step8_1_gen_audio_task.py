@@ -3,12 +3,13 @@ import datetime
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import re
-from core.ask_gpt import ask_gpt
+from core.ask_gpt import ask_gpt_async
+from core.llm_engine import run_all
 from core.prompts_storage import get_subtitle_trim_prompt
 from rich import print as rprint
 from rich.panel import Panel
 from rich.console import Console
-from core.config_utils import load_key  
+from core.config_utils import load_key, pinned_config
 from core.all_tts_functions.estimate_duration import init_estimator, estimate_duration
 
 console = Console()
@@ -19,33 +20,39 @@ SRC_SUBS_FOR_AUDIO_FILE = 'output/audio/src_subs_for_audio.srt'
 SOVITS_TASKS_FILE = 'output/audio/tts_tasks.xlsx'
 ESTIMATOR = None
 
-def check_len_then_trim(text, duration):
+def estimate_reading_duration(text):
     global ESTIMATOR
     if ESTIMATOR is None:
         ESTIMATOR = init_estimator()
-    estimated_duration = estimate_duration(text, ESTIMATOR) / speed_factor['max']
-    
-    console.print(f"Subtitle text: {text}, "
-                  f"[bold green]Estimated reading duration: {estimated_duration:.2f} seconds[/bold green]")
+    return estimate_duration(text, ESTIMATOR) / speed_factor['max']
 
-    if estimated_duration > duration:
-        rprint(Panel(f"Estimated reading duration {estimated_duration:.2f} seconds exceeds given duration {duration:.2f} seconds, shortening...", title="Processing", border_style="yellow"))
-        original_text = text
-        prompt = get_subtitle_trim_prompt(text, duration)
-        def valid_trim(response):
-            if 'result' not in response:
-                return {'status': 'error', 'message': 'No result in response'}
-            return {'status': 'success', 'message': ''}
-        try:    
-            response = ask_gpt(prompt, response_json=True, log_title='subtitle_trim', valid_def=valid_trim)
-            shortened_text = response['result']
-        except Exception:
-            rprint("[bold red]🚫 AI refused to answer due to sensitivity, so manually remove punctuation[/bold red]")
-            shortened_text = re.sub(r'[,.!?;:，。！？；：]', ' ', text).strip()
-        rprint(Panel(f"Subtitle before shortening: {original_text}\nSubtitle after shortening: {shortened_text}", title="Subtitle Shortening Result", border_style="green"))
-        return shortened_text
-    else:
-        return text
+async def shorten_subtitle_async(text, duration, estimated_duration):
+    rprint(Panel(f"Estimated reading duration {estimated_duration:.2f} seconds exceeds given duration {duration:.2f} seconds, shortening...", title="Processing", border_style="yellow"))
+    original_text = text
+    prompt = get_subtitle_trim_prompt(text, duration)
+    def valid_trim(response):
+        if 'result' not in response:
+            return {'status': 'error', 'message': 'No result in response'}
+        return {'status': 'success', 'message': ''}
+    try:    
+        response = await ask_gpt_async(prompt, response_json=True, log_title='subtitle_trim', valid_def=valid_trim)
+        shortened_text = response['result']
+    except Exception:
+        rprint("[bold red]🚫 AI refused to answer due to sensitivity, so manually remove punctuation[/bold red]")
+        shortened_text = re.sub(r'[,.!?;:，。！？；：]', ' ', text).strip()
+    rprint(Panel(f"Subtitle before shortening: {original_text}\nSubtitle after shortening: {shortened_text}", title="Subtitle Shortening Result", border_style="green"))
+    return shortened_text
+
+def trim_subtitles(texts, durations):
+    """Estimate every line first, then shorten only the over-budget ones concurrently and put them back by index"""
+    estimated = [estimate_reading_duration(text) for text in texts]
+    to_trim = [i for i, (est, dur) in enumerate(zip(estimated, durations)) if est > dur]
+    console.print(f"[cyan]✂️ {len(to_trim)} of {len(texts)} subtitles exceed their duration and will be shortened[/cyan]")
+    trimmed = list(texts)
+    shortened = run_all([shorten_subtitle_async(texts[i], durations[i], estimated[i]) for i in to_trim])
+    for i, text in zip(to_trim, shortened):
+        trimmed[i] = text
+    return trimmed
 
 def time_diff_seconds(t1, t2, base_date):
     """Calculate the difference in seconds between two time objects"""
@@ -130,12 +137,9 @@ def process_srt():
     df['start_time'] = df['start_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
     df['end_time'] = df['end_time'].apply(lambda x: x.strftime('%H:%M:%S.%f')[:-3])
 
-    ##! No longer perform secondary trim
-    # check and trim subtitle length, for twice to ensure the subtitle length is within the limit, 允许tolerance
-    # df['text'] = df.apply(lambda x: check_len_then_trim(x['text'], x['duration']+x['tolerance']), axis=1)
-
     return df
 
+@pinned_config()
 def gen_audio_task_main():
     if os.path.exists(SOVITS_TASKS_FILE):
         rprint(Panel(f"{SOVITS_TASKS_FILE} already exists, skip.", title="Info", border_style="blue"))
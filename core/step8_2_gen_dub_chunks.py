@@ -1,8 +1,8 @@
 import pandas as pd
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.config_utils import load_key
-from core.all_whisper_methods.whisperX_utils import get_audio_duration
+from core.config_utils import load_key, pinned_config
+from core.media_probe import get_audio_duration
 from core.step8_1_gen_audio_task import time_diff_seconds
 import datetime
 import re
@@ -133,6 +133,7 @@ def process_cutoffs(df):
     
     return df
 
+@pinned_config()
 def gen_dub_chunks():
     rprint("[🎬 Starting] Generating dubbing chunks...")
     df = pd.read_excel(INPUT_EXCEL)
@@ -8,6 +8,7 @@ import pandas as pd
 import soundfile as sf
 console = Console()
 from core.all_whisper_methods.demucs_vl import demucs_main, VOCAL_AUDIO_FILE
+from core.all_whisper_methods.pcm_audio import open_pcm
 
 # Simplified path definitions
 REF_DIR = 'output/audio/refers'
@@ -38,7 +39,9 @@ def extract_refer_audio_main():
     
     # Read task file and audio data
     df = pd.read_excel(TASKS_FILE)
-    data, sr = sf.read(VOCAL_AUDIO_FILE)
+    # Mapped, not read: each reference clip is a slice of the decoded vocals
+    vocals = open_pcm(VOCAL_AUDIO_FILE)
+    data, sr = vocals.samples, vocals.sample_rate
     
     with Progress(
         SpinnerColumn(),
@@ -0,0 +1,84 @@
+import os, sys, json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collections import deque
+from threading import Lock
+
+def _is_word_char(char: str) -> bool:
+    """Letters and digits of space-delimited scripts. CJK and kana are not, since those words are not separated by spaces"""
+    if not char.isalnum():
+        return False
+    code = ord(char)
+    if 0x3040 <= code <= 0x30FF or 0x3400 <= code <= 0x9FFF or 0xF900 <= code <= 0xFAFF:
+        return False
+    return True
+
+class TermIndex:
+    """Aho-Corasick automaton over the lowercased source terms of a glossary, built once and matched in one pass"""
+    def __init__(self, terms: list):
+        self.terms = terms
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # (term index, term length) ending at this state
+        for term_idx, term in enumerate(terms):
+            pattern = term['src'].lower()
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.out[state].append((term_idx, len(pattern)))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def _at_boundary(self, text: str, start: int, end: int) -> bool:
+        # A term edge that is a word char must not continue into a neighbouring word char, e.g. "AI" in "said"
+        if start > 0 and _is_word_char(text[start]) and _is_word_char(text[start - 1]):
+            return False
+        if end < len(text) and _is_word_char(text[end - 1]) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def match(self, text: str) -> list:
+        """Return the term records found in `text`, in glossary order"""
+        text = text.lower()
+        found = set()
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for term_idx, length in self.out[state]:
+                if term_idx not in found and self._at_boundary(text, pos + 1 - length, pos + 1):
+                    found.add(term_idx)
+        return [self.terms[i] for i in sorted(found)]
+
+_INDEX = None  # (stamp, TermIndex), swapped as one object so lock-free readers never see a mismatched pair
+_INDEX_LOCK = Lock()
+
+def load_term_index(path: str) -> TermIndex:
+    """Build the index for a terminology file once, rebuild only when the file changes"""
+    global _INDEX
+    stat = os.stat(path)
+    stamp = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    cached = _INDEX
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX[0] != stamp:
+            with open(path, 'r', encoding='utf-8') as file:
+                _INDEX = (stamp, TermIndex(json.load(file)['terms']))
+        return _INDEX[1]
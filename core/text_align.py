@@ -0,0 +1,114 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Extra band width for the split alignment, on top of the length difference of the two texts
+MIN_BAND = 8
+BAND_RATIO = 0.1
+
+def _normalize(text: str):
+    """Drop whitespace and lowercase, keep where every kept char sits in `text`"""
+    chars, offsets = [], []
+    for pos, char in enumerate(text):
+        if char.isspace():
+            continue
+        lower = char.lower()
+        chars.append(lower if len(lower) == 1 else char)
+        offsets.append(pos)
+    offsets.append(len(text))
+    return ''.join(chars), offsets
+
+def levenshtein(a: str, b: str) -> int:
+    """Edit distance with the bit-parallel algorithm of Myers/Hyyrö, one pass over `a` with `b` packed into an int"""
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if not m:
+        return len(a)
+    peq = {}
+    for i, char in enumerate(b):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for char in a:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+def similarity(a: str, b: str) -> float:
+    """1 - edit distance / longer length, over whitespace-free lowercased text"""
+    a, b = _normalize(a)[0], _normalize(b)[0]
+    longest = max(len(a), len(b))
+    return 1.0 if not longest else 1 - levenshtein(a, b) / longest
+
+def _align(a: str, b: str, band: int) -> tuple:
+    """Banded edit-distance DP (|i - j| <= band) with backtrace.
+    Returns (distance, mapping) where mapping[j] is the position in `a` once j chars of `b` are consumed"""
+    n, m = len(a), len(b)
+    inf = n + m + 1
+    cost = [[inf] * (2 * band + 1) for _ in range(n + 1)]
+    move = [[0] * (2 * band + 1) for _ in range(n + 1)]  # 0 match/substitute, 1 drop a char of `a`, 2 insert a char of `b`
+    for i in range(n + 1):
+        row, moves = cost[i], move[i]
+        prev = cost[i - 1] if i else None
+        for j in range(max(0, i - band), min(m, i + band) + 1):
+            k = j - i + band
+            if i == 0:
+                row[k], moves[k] = j, 2
+                continue
+            best, step = inf, 0
+            if j:
+                best = prev[k] + (a[i - 1] != b[j - 1])
+            if k + 1 <= 2 * band and prev[k + 1] + 1 < best:
+                best, step = prev[k + 1] + 1, 1
+            if j and k and row[k - 1] + 1 < best:
+                best, step = row[k - 1] + 1, 2
+            row[k], moves[k] = best, step
+    mapping = [0] * (m + 1)
+    i, j = n, m
+    mapping[m] = n
+    while i or j:
+        step = move[i][j - i + band]
+        if step == 0:
+            i, j = i - 1, j - 1
+        elif step == 1:
+            i -= 1
+        else:
+            j -= 1
+        # Walking backwards the first i seen for j is the largest, so chars dropped at a cut stay on its left
+        if step != 1:
+            mapping[j] = i
+    return cost[n][m - n + band], mapping
+
+def align_split_offsets(original: str, parts: list) -> tuple:
+    """Map an edited split of `original` back onto it in one alignment.
+    Returns (offsets in `original` where parts 2..n start, confidence in 0-1)"""
+    norm_original, offsets = _normalize(original)
+    norm_parts = [_normalize(part)[0] for part in parts]
+    modified = ''.join(norm_parts)
+    cuts = []
+    for part in norm_parts[:-1]:
+        cuts.append((cuts[-1] if cuts else 0) + len(part))
+    if modified == norm_original:
+        # Unchanged text, the common case, needs no DP
+        return [offsets[cut] for cut in cuts], 1.0
+    longest = max(len(norm_original), len(modified))
+    band = abs(len(norm_original) - len(modified)) + max(MIN_BAND, int(longest * BAND_RATIO))
+    distance, mapping = _align(norm_original, modified, band)
+    return [offsets[mapping[cut]] for cut in cuts], 1 - distance / longest
+
+if __name__ == "__main__":
+    original = "我们昨天去了商店，因为牛奶喝完了，孩子们一直在要麦片。"
+    print(align_split_offsets(original, ["我们昨天去了商店，因为牛奶喝完了", "孩子们一直要麦片"]))
+    print(similarity("The quick brown fox", "the quick brown box"))
@@ -1,6 +1,7 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.ask_gpt import ask_gpt
+from core.ask_gpt import ask_gpt_async
+from core.llm_engine import run_sync
 from core.prompts_storage import generate_shared_prompt, get_prompt_faithfulness, get_prompt_expressiveness
 from rich.panel import Panel
 from rich.console import Console
@@ -21,36 +22,38 @@ def valid_translate_result(result: dict, required_keys: list, required_sub_keys:
 
     return {"status": "success", "message": "Translation completed"}
 
-def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0):
+async def translate_lines_async(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0):
     shared_prompt = generate_shared_prompt(previous_content_prompt, after_cotent_prompt, summary_prompt, things_to_note_prompt)
 
-    # Retry translation if the length of the original text and the translated text are not the same, or if the specified key is missing
-    def retry_translation(prompt, step_name):
+    # The translation must keep the line count and the expected keys, otherwise the LLM is asked again
+    async def retry_translation(prompt, step_name):
+        # Line count is checked inside the validator, so a mismatched response is never cached and a retry asks the LLM again
+        line_count = len(lines.split('\n'))
+        def valid_line_count(response_data, required_sub_keys):
+            if len(response_data) != line_count:
+                return {"status": "error", "message": f"Expected {line_count} lines, got {len(response_data)}"}
+            return valid_translate_result(response_data, ['1'], required_sub_keys)
         def valid_faith(response_data):
-            return valid_translate_result(response_data, ['1'], ['direct'])
+            return valid_line_count(response_data, ['direct'])
         def valid_express(response_data):
-            return valid_translate_result(response_data, ['1'], ['free'])
-        for retry in range(3):
-            if step_name == 'faithfulness':
-                result = ask_gpt(prompt+retry* " ", response_json=True, valid_def=valid_faith, log_title=f'translate_{step_name}')
-            elif step_name == 'expressiveness':
-                result = ask_gpt(prompt+retry* " ", response_json=True, valid_def=valid_express, log_title=f'translate_{step_name}')
-            if len(lines.split('\n')) == len(result):
-                return result
-            if retry != 2:
-                console.print(f'[yellow]⚠️ {step_name.capitalize()} translation of block {index} failed, Retry...[/yellow]')
-        raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 retries. Please check `output/gpt_log/error.json` for more details.[/red]')
+            return valid_line_count(response_data, ['free'])
+        # ask_gpt retries by itself and raises once its retries run out
+        valid_def = valid_faith if step_name == 'faithfulness' else valid_express
+        try:
+            return await ask_gpt_async(prompt, response_json=True, valid_def=valid_def, log_title=f'translate_{step_name}')
+        except Exception as e:
+            raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed: {e}. Please check `output/gpt_log/error.jsonl` for more details.[/red]') from e
 
     ## Step 1: Faithful to the Original Text
     prompt1 = get_prompt_faithfulness(lines, shared_prompt)
-    faith_result = retry_translation(prompt1, 'faithfulness')
+    faith_result = await retry_translation(prompt1, 'faithfulness')
 
     for i in faith_result:
         faith_result[i]["direct"] = faith_result[i]["direct"].replace('\n', ' ')
 
     ## Step 2: Express Smoothly  
     prompt2 = get_prompt_expressiveness(faith_result, lines, shared_prompt)
-    express_result = retry_translation(prompt2, 'expressiveness')
+    express_result = await retry_translation(prompt2, 'expressiveness')
 
     table = Table(title="Translation Results", show_header=False, box=box.ROUNDED)
     table.add_column("Translations", style="bold")
@@ -66,11 +69,15 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
     translate_result = "\n".join([express_result[i]["free"].replace('\n', ' ').strip() for i in express_result])
 
     if len(lines.split('\n')) != len(translate_result.split('\n')):
-        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/gpt_log/translate_expressiveness.json`[/red]'))
+        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/gpt_log/translate_expressiveness.jsonl`[/red]'))
         raise ValueError(f'Origin ···{lines}···,\nbut got ···{translate_result}···')
 
     return translate_result, lines
 
+def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0):
+    """Blocking wrapper over `translate_lines_async`"""
+    return run_sync(translate_lines_async(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index))
+
 
 if __name__ == '__main__':
     # test e.g.
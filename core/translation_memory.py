@@ -0,0 +1,155 @@
+import os, sys, re, time, zlib, random, sqlite3
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pathlib import Path
+from threading import Lock
+from core.config_utils import load_key
+
+# MinHash signature = BANDS x ROWS values, two sentences become fuzzy candidates when any band matches
+BANDS, ROWS = 8, 4
+NGRAM = 3
+MAX_CANDIDATES = 20
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20241)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS)]
+
+_CONN = None
+_CONN_PATH = None
+_RO_CONN = None
+_RO_CONN_PATH = None
+_LOCK = Lock()
+_PUTS_SINCE_EVICT = 0
+EVICT_EVERY = 1000
+
+def normalize_sentence(sentence: str) -> str:
+    return re.sub(r'\s+', ' ', sentence.strip().lower())
+
+def _shingles(norm: str) -> set:
+    if len(norm) <= NGRAM:
+        return {norm}
+    return {norm[i:i + NGRAM] for i in range(len(norm) - NGRAM + 1)}
+
+def _band_keys(shingles: set) -> list:
+    hashed = [zlib.crc32(s.encode('utf-8')) for s in shingles]
+    signature = [min((a * h + b) % _PRIME for h in hashed) for a, b in _PERMUTATIONS]
+    return [f"{band}:{zlib.crc32(repr(signature[band * ROWS:(band + 1) * ROWS]).encode())}" for band in range(BANDS)]
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def _get_conn():
+    global _CONN, _CONN_PATH
+    path = load_key("translation_memory.path")
+    if _CONN is not None and _CONN_PATH == path:
+        return _CONN
+    if _CONN is not None:
+        _CONN.close()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS segments (
+        id INTEGER PRIMARY KEY,
+        lang TEXT NOT NULL,
+        norm_src TEXT NOT NULL,
+        tgt TEXT NOT NULL,
+        created REAL NOT NULL,
+        accessed REAL NOT NULL,
+        UNIQUE (lang, norm_src)
+    )""")
+    conn.execute("CREATE TABLE IF NOT EXISTS bands (band TEXT NOT NULL, segment_id INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_band ON bands(band)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_segment ON bands(segment_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_accessed ON segments(accessed)")
+    _CONN, _CONN_PATH = conn, path
+    _evict(conn)
+    return conn
+
+def _evict(conn):
+    """Drop entries older than `max_age_days`, then the least recently used ones beyond `max_entries`"""
+    max_age_days = load_key("translation_memory.max_age_days")
+    max_entries = load_key("translation_memory.max_entries")
+    if max_age_days:
+        conn.execute("DELETE FROM segments WHERE created < ?", (time.time() - max_age_days * 86400,))
+    if max_entries:
+        conn.execute("""DELETE FROM segments WHERE id IN (
+            SELECT id FROM segments ORDER BY accessed DESC LIMIT -1 OFFSET ?)""", (max_entries,))
+    conn.execute("DELETE FROM bands WHERE segment_id NOT IN (SELECT id FROM segments)")
+    conn.commit()
+
+def _get_read_only_conn():
+    """A connection that can neither create, evict nor touch anything, None while there is no memory yet"""
+    global _RO_CONN, _RO_CONN_PATH
+    path = load_key("translation_memory.path")
+    if _RO_CONN is not None and _RO_CONN_PATH == path:
+        return _RO_CONN
+    if _RO_CONN is not None:
+        _RO_CONN.close()
+        _RO_CONN = None
+    if not os.path.exists(path):
+        return None
+    _RO_CONN = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True, check_same_thread=False, timeout=30)
+    _RO_CONN_PATH = path
+    return _RO_CONN
+
+def _find(conn, norm: str, lang: str):
+    """(id, tgt, norm_src) of the exact match, else of the closest fuzzy match above the threshold, else None"""
+    row = conn.execute("SELECT id, tgt, norm_src FROM segments WHERE lang = ? AND norm_src = ?", (lang, norm)).fetchone()
+    threshold = load_key("translation_memory.fuzzy_threshold")
+    if row is None and threshold < 1:
+        shingles = _shingles(norm)
+        bands = _band_keys(shingles)
+        # Segments sharing more bands are more similar, only verify the best few
+        candidates = conn.execute(f"""SELECT s.id, s.tgt, s.norm_src FROM bands b JOIN segments s ON s.id = b.segment_id
+            WHERE s.lang = ? AND b.band IN ({','.join('?' * len(bands))})
+            GROUP BY s.id ORDER BY COUNT(*) DESC LIMIT ?""", (lang, *bands, MAX_CANDIDATES)).fetchall()
+        scored = [(_jaccard(shingles, _shingles(c_norm)), c_id, c_tgt) for c_id, c_tgt, c_norm in candidates]
+        best = max(scored, default=None)
+        if best is not None and best[0] >= threshold:
+            row = next((c_id, c_tgt, c_norm) for c_id, c_tgt, c_norm in candidates if c_id == best[1])
+    return row
+
+def lookup(sentence: str, lang: str, read_only: bool = False):
+    """Return (remembered source, translation, exact) for `sentence`: the exact match first, then the closest fuzzy match
+    above the threshold. None if unknown. Only exact matches may be reused as they are, a fuzzy one can differ in a number or a negation.
+    `read_only` leaves the memory as it is (no `accessed` update, no eviction), e.g. for a dry run"""
+    if not load_key("translation_memory.enabled"):
+        return None
+    norm = normalize_sentence(sentence)
+    with _LOCK:
+        if read_only:
+            conn = _get_read_only_conn()
+            row = _find(conn, norm, lang) if conn is not None else None
+        else:
+            conn = _get_conn()
+            row = _find(conn, norm, lang)
+            if row is not None:
+                conn.execute("UPDATE segments SET accessed = ? WHERE id = ?", (time.time(), row[0]))
+                conn.commit()
+    if row is None:
+        return None
+    return row[2], row[1], row[2] == norm
+
+def remember(pairs: list, lang: str) -> None:
+    """Store (source sentence, translation) pairs"""
+    global _PUTS_SINCE_EVICT
+    if not load_key("translation_memory.enabled"):
+        return
+    now = time.time()
+    with _LOCK:
+        conn = _get_conn()
+        for src, tgt in pairs:
+            norm = normalize_sentence(src)
+            if not norm:
+                continue
+            existing = conn.execute("SELECT id FROM segments WHERE lang = ? AND norm_src = ?", (lang, norm)).fetchone()
+            if existing:
+                conn.execute("UPDATE segments SET tgt = ?, accessed = ? WHERE id = ?", (tgt, now, existing[0]))
+                continue
+            segment_id = conn.execute("INSERT INTO segments (lang, norm_src, tgt, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                                      (lang, norm, tgt, now, now)).lastrowid
+            conn.executemany("INSERT INTO bands (band, segment_id) VALUES (?, ?)", [(band, segment_id) for band in _band_keys(_shingles(norm))])
+        conn.commit()
+        _PUTS_SINCE_EVICT += len(pairs)
+        if _PUTS_SINCE_EVICT >= EVICT_EVERY:
+            _PUTS_SINCE_EVICT = 0
+            _evict(conn)
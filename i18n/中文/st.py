@@ -44,6 +44,7 @@ def text_processing_section():
 
 def process_text():
     with st.spinner("使用 Whisper 进行转录中..."):
+        prewarm_nlp()  # 在 Whisper 转录期间预先加载 spaCy 模型
         step2_whisperX.transcribe()
     with st.spinner("分割长句中..."):  
         step3_1_spacy_split.split_by_spacy()
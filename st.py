@@ -44,6 +44,7 @@ def text_processing_section():
 
 def process_text():
     with st.spinner("Using Whisper for transcription..."):
+        prewarm_nlp()  # load spaCy for the splitting step while Whisper runs
         step2_whisperX.transcribe()
     with st.spinner("Splitting long sentences..."):  
         step3_1_spacy_split.split_by_spacy()
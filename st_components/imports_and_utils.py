@@ -27,6 +27,7 @@ from core import (
     step12_merge_dub_to_vid
 )
 from core.onekeycleanup import cleanup  
+from core.spacy_utils.load_nlp_model import prewarm_nlp
 from core.delete_retry_dubbing import delete_dubbing_files
 from core.ask_gpt import ask_gpt
 import streamlit as st
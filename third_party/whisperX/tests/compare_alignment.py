@@ -0,0 +1,211 @@
+"""Check the vectorised forced alignment in whisperx/alignment.py against the original per-frame torch loop.
+
+Runs both implementations over the saved emissions in `alignment_fixture.npz` and fails on any difference in the
+trellis, the character spans (start, end, score), the backtrack failures or the merged words, then prints timings.
+
+    python tests/compare_alignment.py               # compare
+    python tests/compare_alignment.py --regenerate  # rebuild the fixture (fixed seed)
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from whisperx.alignment import backtrack, get_trellis, merge_words
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alignment_fixture.npz")
+SEPARATOR = "|"
+
+
+# Reference: the loop implementation whisperx shipped before the vectorised one (torchaudio forced alignment tutorial)
+def ref_get_trellis(emission, tokens, blank_id=0):
+    num_frame = emission.size(0)
+    num_tokens = len(tokens)
+
+    trellis = torch.empty((num_frame + 1, num_tokens + 1))
+    trellis[0, 0] = 0
+    trellis[1:, 0] = torch.cumsum(emission[:, 0], 0)
+    trellis[0, -num_tokens:] = -float("inf")
+    trellis[-num_tokens:, 0] = float("inf")
+
+    for t in range(num_frame):
+        trellis[t + 1, 1:] = torch.maximum(
+            # Score for staying at the same token
+            trellis[t, 1:] + emission[t, blank_id],
+            # Score for changing to the next token
+            trellis[t, :-1] + emission[t, tokens],
+        )
+    return trellis
+
+
+@dataclass
+class Point:
+    token_index: int
+    time_index: int
+    score: float
+
+
+def ref_backtrack(trellis, emission, tokens, blank_id=0):
+    j = trellis.size(1) - 1
+    t_start = torch.argmax(trellis[:, j]).item()
+
+    path = []
+    for t in range(t_start, 0, -1):
+        stayed = trellis[t - 1, j] + emission[t - 1, blank_id]
+        changed = trellis[t - 1, j - 1] + emission[t - 1, tokens[j - 1]]
+
+        prob = emission[t - 1, tokens[j - 1] if changed > stayed else 0].exp().item()
+        path.append(Point(j - 1, t - 1, prob))
+
+        if changed > stayed:
+            j -= 1
+            if j == 0:
+                break
+    else:
+        # failed
+        return None
+    return path[::-1]
+
+
+@dataclass
+class Segment:
+    label: str
+    start: int
+    end: int
+    score: float
+
+    @property
+    def length(self):
+        return self.end - self.start
+
+
+def ref_merge_repeats(path, transcript):
+    i1, i2 = 0, 0
+    segments = []
+    while i1 < len(path):
+        while i2 < len(path) and path[i1].token_index == path[i2].token_index:
+            i2 += 1
+        score = sum(path[k].score for k in range(i1, i2)) / (i2 - i1)
+        segments.append(
+            Segment(
+                transcript[path[i1].token_index],
+                path[i1].time_index,
+                path[i2 - 1].time_index + 1,
+                score,
+            )
+        )
+        i1 = i2
+    return segments
+
+
+def ref_merge_words(segments, separator="|"):
+    words = []
+    i1, i2 = 0, 0
+    while i1 < len(segments):
+        if i2 >= len(segments) or segments[i2].label == separator:
+            if i1 != i2:
+                segs = segments[i1:i2]
+                word = "".join([seg.label for seg in segs])
+                score = sum(seg.score * seg.length for seg in segs) / sum(seg.length for seg in segs)
+                words.append(Segment(word, segments[i1].start, segments[i2 - 1].end, score))
+            i1 = i2 + 1
+            i2 = i1
+        else:
+            i2 += 1
+    return words
+
+
+def regenerate(num_cases=24, vocab=16, seed=0):
+    """Emissions shaped like wav2vec2 ones: blank dominates, each token peaks on one frame.
+    Some have more tokens than frames so the backtrack fails, some use a non-zero blank id."""
+    rng = np.random.default_rng(seed)
+    emissions, tokens, transcripts, blank_ids, num_frames, num_tokens = [], [], [], [], [], []
+    for case in range(num_cases):
+        frames = int(rng.integers(5, 160))
+        n = frames + int(rng.integers(1, 4)) if case % 8 == 0 else int(rng.integers(1, frames // 2 + 2))
+        blank_id = 0 if case % 5 else 3
+        toks = rng.choice([t for t in range(1, vocab) if t != blank_id], n).tolist()
+        logits = rng.normal(0, 1, (frames, vocab)).astype(np.float32)
+        logits[:, blank_id] += 4
+        for p, tok in zip(np.sort(rng.choice(frames, size=min(n, frames), replace=False)), toks):
+            logits[p, tok] += 8
+        if case % 3 == 0:
+            logits = np.round(logits)  # ties between staying and changing
+        emissions.append(torch.log_softmax(torch.from_numpy(logits), -1).numpy())
+        tokens.extend(toks)
+        transcripts.append("".join(SEPARATOR if t % 7 == 0 else chr(96 + t) for t in toks))
+        blank_ids.append(blank_id)
+        num_frames.append(frames)
+        num_tokens.append(n)
+    np.savez_compressed(
+        FIXTURE,
+        emissions=np.concatenate(emissions),
+        tokens=np.asarray(tokens, dtype=np.int64),
+        transcripts=np.asarray(transcripts),
+        blank_ids=np.asarray(blank_ids, dtype=np.int64),
+        num_frames=np.asarray(num_frames, dtype=np.int64),
+        num_tokens=np.asarray(num_tokens, dtype=np.int64),
+    )
+    print(f"Wrote {num_cases} cases to {FIXTURE}")
+
+
+def load_cases():
+    data = np.load(FIXTURE)
+    frame_ends = np.cumsum(data["num_frames"])
+    token_ends = np.cumsum(data["num_tokens"])
+    for case in range(len(data["num_frames"])):
+        emission = data["emissions"][frame_ends[case] - data["num_frames"][case]:frame_ends[case]]
+        tokens = data["tokens"][token_ends[case] - data["num_tokens"][case]:token_ends[case]].tolist()
+        yield case, emission, tokens, str(data["transcripts"][case]), int(data["blank_ids"][case])
+
+
+def compare():
+    aligned = failed = 0
+    ref_time = new_time = 0.0
+    for case, emission, tokens, transcript, blank_id in load_cases():
+        emission_t = torch.from_numpy(emission)
+
+        t0 = time.perf_counter()
+        ref_trellis = ref_get_trellis(emission_t, tokens, blank_id)
+        path = ref_backtrack(ref_trellis, emission_t, tokens, blank_id)
+        ref_words = ref_merge_words(ref_merge_repeats(path, transcript), SEPARATOR) if path is not None else None
+        t1 = time.perf_counter()
+        trellis, changed = get_trellis(emission, tokens, blank_id)
+        spans = backtrack(trellis, changed, emission, tokens, blank_id)
+        words = merge_words(spans, transcript, SEPARATOR) if spans is not None else None
+        t2 = time.perf_counter()
+        ref_time += t1 - t0
+        new_time += t2 - t1
+
+        assert np.array_equal(ref_trellis.numpy(), trellis, equal_nan=True), f"case {case}: trellis differs"
+        if path is None:
+            assert spans is None, f"case {case}: only the reference failed to backtrack"
+            failed += 1
+            continue
+        assert spans is not None, f"case {case}: only the new implementation failed to backtrack"
+        segments = ref_merge_repeats(path, transcript)
+        assert [s.start for s in segments] == spans.starts.tolist(), f"case {case}: span starts differ"
+        assert [s.end for s in segments] == spans.ends.tolist(), f"case {case}: span ends differ"
+        assert np.allclose([s.score for s in segments], spans.scores, rtol=1e-6), f"case {case}: span scores differ"
+        assert [(w.label, w.start, w.end) for w in ref_words] == [(w.label, w.start, w.end) for w in words], \
+            f"case {case}: words differ"
+        assert np.allclose([w.score for w in ref_words], [w.score for w in words], rtol=1e-6), \
+            f"case {case}: word scores differ"
+        aligned += 1
+
+    print(f"Identical: {aligned} aligned, {failed} failing in both")
+    print(f"Reference loop {ref_time:.3f}s, vectorised {new_time:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the fixture before comparing")
+    args = parser.parse_args()
+    if args.regenerate:
+        regenerate()
+    compare()
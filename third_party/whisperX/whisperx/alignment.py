@@ -21,6 +21,9 @@ PUNKT_ABBREVIATIONS = ['dr', 'vs', 'mr', 'mrs', 'prof']
 
 LANGUAGES_WITHOUT_SPACES = ["ja", "zh"]
 
+# wav2vec2 needs at least one 400-sample window, shorter segments are zero padded to it
+MIN_WAVEFORM_SAMPLES = 400
+
 DEFAULT_ALIGN_MODELS_TORCH = {
     "en": "WAV2VEC2_ASR_BASE_960H",
     "fr": "VOXPOPULI_ASR_BASE_10K_FR",
@@ -107,9 +110,12 @@ def align(
     return_char_alignments: bool = False,
     print_progress: bool = False,
     combined_progress: bool = False,
+    batch_size: int = 1,
 ) -> AlignedTranscriptionResult:
     """
     Align phoneme recognition predictions to known transcription.
+    `batch_size` segments of similar length share one forward pass of the alignment model. Only models that mask
+    padding exactly are batched, see `pads_exactly`.
     """
     
     if not torch.is_tensor(audio):
@@ -125,6 +131,26 @@ def align(
     model_lang = align_model_metadata["language"]
     model_type = align_model_metadata["type"]
 
+    # character -> its dictionary form, None if the model cannot align it; shared by every segment
+    char_table = {}
+    def dictionary_char(char):
+        if char not in char_table:
+            char_ = char.lower()
+            # wav2vec2 models use "|" character to represent spaces
+            if model_lang not in LANGUAGES_WITHOUT_SPACES:
+                char_ = char_.replace(" ", "|")
+            char_table[char] = char_ if char_ in model_dictionary else None
+        return char_table[char]
+
+    punkt_param = PunktParameters()
+    punkt_param.abbrev_types = set(PUNKT_ABBREVIATIONS)
+    sentence_splitter = PunktSentenceTokenizer(punkt_param)
+
+    blank_id = 0
+    for char, code in model_dictionary.items():
+        if char == '[pad]' or char == '<pad>':
+            blank_id = code
+
     # 1. Preprocess to keep only characters in dictionary
     total_segments = len(transcript)
     for sdx, segment in enumerate(transcript):
@@ -144,31 +170,12 @@ def align(
         else:
             per_word = text
 
-        clean_char, clean_cdx = [], []
-        for cdx, char in enumerate(text):
-            char_ = char.lower()
-            # wav2vec2 models use "|" character to represent spaces
-            if model_lang not in LANGUAGES_WITHOUT_SPACES:
-                char_ = char_.replace(" ", "|")
-            
-            # ignore whitespace at beginning and end of transcript
-            if cdx < num_leading:
-                pass
-            elif cdx > len(text) - num_trailing - 1:
-                pass
-            elif char_ in model_dictionary.keys():
-                clean_char.append(char_)
-                clean_cdx.append(cdx)
-
-        clean_wdx = []
-        for wdx, wrd in enumerate(per_word):
-            if any([c in model_dictionary.keys() for c in wrd]):
-                clean_wdx.append(wdx)
-
-                
-        punkt_param = PunktParameters()
-        punkt_param.abbrev_types = set(PUNKT_ABBREVIATIONS)
-        sentence_splitter = PunktSentenceTokenizer(punkt_param)
+        # ignore whitespace at beginning and end of transcript
+        clean_cdx = [cdx for cdx in range(num_leading, len(text) - num_trailing) if dictionary_char(text[cdx]) is not None]
+        clean_char = [dictionary_char(text[cdx]) for cdx in clean_cdx]
+
+        clean_wdx = [wdx for wdx, wrd in enumerate(per_word) if any(c in model_dictionary for c in wrd)]
+
         sentence_spans = list(sentence_splitter.span_tokenize(text))
 
         segment["clean_char"] = clean_char
@@ -177,91 +184,40 @@ def align(
         segment["sentence_spans"] = sentence_spans
     
     aligned_segments: List[SingleAlignedSegment] = []
-    
-    # 2. Get prediction matrix from alignment model & align
-    for sdx, segment in enumerate(transcript):
-        
+
+    # 2. Get prediction matrices from alignment model in length-sorted batches, and align each batch as soon as
+    # its emissions are in, so only one batch of emissions is held in memory at a time
+    def align_segment(segment, emission):
+        """Aligned sub-segments of one segment, None if the backtrack fails"""
         t1 = segment["start"]
         t2 = segment["end"]
         text = segment["text"]
 
-        aligned_seg: SingleAlignedSegment = {
-            "start": t1,
-            "end": t2,
-            "text": text,
-            "words": [],
-        }
-
-        if return_char_alignments:
-            aligned_seg["chars"] = []
-
-        # check we can align
-        if len(segment["clean_char"]) == 0:
-            print(f'Failed to align segment ("{segment["text"]}"): no characters in this segment found in model dictionary, resorting to original...')
-            aligned_segments.append(aligned_seg)
-            continue
-
-        if t1 >= MAX_DURATION:
-            print(f'Failed to align segment ("{segment["text"]}"): original start time longer than audio duration, skipping...')
-            aligned_segments.append(aligned_seg)
-            continue
-
         text_clean = "".join(segment["clean_char"])
         tokens = [model_dictionary[c] for c in text_clean]
 
-        f1 = int(t1 * SAMPLE_RATE)
-        f2 = int(t2 * SAMPLE_RATE)
-
-        # TODO: Probably can get some speedup gain with batched inference here
-        waveform_segment = audio[:, f1:f2]
-        # Handle the minimum input length for wav2vec2 models
-        if waveform_segment.shape[-1] < 400:
-            lengths = torch.as_tensor([waveform_segment.shape[-1]]).to(device)
-            waveform_segment = torch.nn.functional.pad(
-                waveform_segment, (0, 400 - waveform_segment.shape[-1])
-            )
-        else:
-            lengths = None
-            
-        with torch.inference_mode():
-            if model_type == "torchaudio":
-                emissions, _ = model(waveform_segment.to(device), lengths=lengths)
-            elif model_type == "huggingface":
-                emissions = model(waveform_segment.to(device)).logits
-            else:
-                raise NotImplementedError(f"Align model of type {model_type} not supported.")
-            emissions = torch.log_softmax(emissions, dim=-1)
-
-        emission = emissions[0].cpu().detach()
-
-        blank_id = 0
-        for char, code in model_dictionary.items():
-            if char == '[pad]' or char == '<pad>':
-                blank_id = code
+        trellis, changed = get_trellis(emission, tokens, blank_id)
+        spans = backtrack(trellis, changed, emission, tokens, blank_id)
 
-        trellis = get_trellis(emission, tokens, blank_id)
-        path = backtrack(trellis, emission, tokens, blank_id)
-
-        if path is None:
+        if spans is None:
             print(f'Failed to align segment ("{segment["text"]}"): backtrack failed, resorting to original...')
-            aligned_segments.append(aligned_seg)
-            continue
-
-        char_segments = merge_repeats(path, text_clean)
+            return None
 
         duration = t2 -t1
-        ratio = duration * waveform_segment.size(0) / (trellis.size(0) - 1)
+        ratio = duration / (trellis.shape[0] - 1)
 
         # assign timestamps to aligned characters
+        span_of_cdx = {cdx: i for i, cdx in enumerate(segment["clean_cdx"])}
+        span_starts, span_ends, span_scores = spans.starts.tolist(), spans.ends.tolist(), spans.scores.tolist()
         char_segments_arr = []
         word_idx = 0
         for cdx, char in enumerate(text):
             start, end, score = None, None, None
-            if cdx in segment["clean_cdx"]:
-                char_seg = char_segments[segment["clean_cdx"].index(cdx)]
-                start = round(char_seg.start * ratio + t1, 3)
-                end = round(char_seg.end * ratio + t1, 3)
-                score = round(char_seg.score, 3)
+            i = span_of_cdx.get(cdx)
+            if i is not None:
+                start = round(span_starts[i] * ratio + t1, 3)
+                end = round(span_ends[i] * ratio + t1, 3)
+                score = round(span_scores[i], 3)
 
             char_segments_arr.append(
                 {
@@ -344,7 +300,50 @@ def align(
             agg_dict["chars"] = "sum"
         aligned_subsegments= aligned_subsegments.groupby(["start", "end"], as_index=False).agg(agg_dict)
         aligned_subsegments = aligned_subsegments.to_dict('records')
-        aligned_segments += aligned_subsegments
+        return aligned_subsegments
+
+    alignable = [
+        sdx for sdx, segment in enumerate(transcript)
+        if len(segment["clean_char"]) > 0 and segment["start"] < MAX_DURATION
+    ]
+    waveforms = [audio[0, int(transcript[sdx]["start"] * SAMPLE_RATE):int(transcript[sdx]["end"] * SAMPLE_RATE)] for sdx in alignable]
+    aligned_by_sdx = {}
+    for i, emission in get_emissions(model, model_type, waveforms, device, batch_size):
+        aligned_by_sdx[alignable[i]] = align_segment(transcript[alignable[i]], emission)
+
+    # 3. Collect in transcript order
+    for sdx, segment in enumerate(transcript):
+        
+        t1 = segment["start"]
+        t2 = segment["end"]
+        text = segment["text"]
+
+        aligned_seg: SingleAlignedSegment = {
+            "start": t1,
+            "end": t2,
+            "text": text,
+            "words": [],
+        }
+
+        if return_char_alignments:
+            aligned_seg["chars"] = []
+
+        # check we can align
+        if len(segment["clean_char"]) == 0:
+            print(f'Failed to align segment ("{segment["text"]}"): no characters in this segment found in model dictionary, resorting to original...')
+            aligned_segments.append(aligned_seg)
+            continue
+
+        if t1 >= MAX_DURATION:
+            print(f'Failed to align segment ("{segment["text"]}"): original start time longer than audio duration, skipping...')
+            aligned_segments.append(aligned_seg)
+            continue
+
+        if aligned_by_sdx[sdx] is None:
+            aligned_segments.append(aligned_seg)
+            continue
+
+        aligned_segments += aligned_by_sdx[sdx]
 
     # create word_segments list
     word_segments: List[SingleWordSegment] = []
@@ -353,38 +352,97 @@ def align(
 
     return {"segments": aligned_segments, "word_segments": word_segments}
 
+def pads_exactly(model, model_type):
+    """Whether zero padding a waveform leaves its emission unchanged. The group norm in the feature extractor of
+    wav2vec2 base models normalises over the padding, models with layer norm only need the padding masked."""
+    if model_type == "huggingface":
+        return model.config.feat_extract_norm == "layer"
+    return not any(isinstance(module, torch.nn.GroupNorm) for module in model.modules())
+
+def get_emissions(model, model_type, waveforms, device, batch_size=1):
+    """Yield (index, frame-wise log-probabilities as frames x vocab numpy) for every 1-D waveform, batch by batch.
+    Waveforms are sorted by length and run `batch_size` at a time, zero padded to the longest of their batch.
+    Padded frames are masked in the model and cut from every emission. Only the current batch is held in memory.
+    Models that do not pad exactly run one waveform at a time."""
+    if not pads_exactly(model, model_type):
+        batch_size = 1
+    lengths = [max(len(waveform), MIN_WAVEFORM_SAMPLES) for waveform in waveforms]
+    order = sorted(range(len(waveforms)), key=lambda i: lengths[i])
+    for first in range(0, len(order), batch_size):
+        rows = order[first:first + batch_size]
+        batch = torch.zeros(len(rows), max(lengths[i] for i in rows))
+        for row, i in enumerate(rows):
+            batch[row, :len(waveforms[i])] = waveforms[i]
+        batch_lengths = torch.as_tensor([lengths[i] for i in rows])
+        padded = bool((batch_lengths < batch.shape[1]).any())
+
+        with torch.inference_mode():
+            if model_type == "torchaudio":
+                logits, frame_lengths = model(batch.to(device), lengths=batch_lengths.to(device) if padded else None)
+            elif model_type == "huggingface":
+                attention_mask = None
+                if padded:
+                    attention_mask = (torch.arange(batch.shape[1])[None, :] < batch_lengths[:, None]).long().to(device)
+                logits = model(batch.to(device), attention_mask=attention_mask).logits
+                frame_lengths = model._get_feat_extract_output_lengths(batch_lengths) if padded else None
+            else:
+                raise NotImplementedError(f"Align model of type {model_type} not supported.")
+            logits = torch.log_softmax(logits, dim=-1).cpu()
+
+        for row, i in enumerate(rows):
+            num_frames = logits.shape[1] if frame_lengths is None else int(frame_lengths[row])
+            yield i, logits[row, :num_frames].numpy()
+        del batch, logits  # before the next batch is computed
+
 """
 source: https://pytorch.org/tutorials/intermediate/forced_alignment_with_torchaudio_tutorial.html
+Same recursion as the tutorial, run over preallocated numpy buffers. The frame loop stays sequential
+in float32, so every max and every stay/change decision is bit for bit the tutorial's.
 """
 def get_trellis(emission, tokens, blank_id=0):
-    num_frame = emission.size(0)
+    """Returns the trellis and the back-pointers `changed`, True where the best path into
+    trellis cell (t, j) comes from token j-1 rather than staying on token j."""
+    emission = np.asarray(emission, dtype=np.float32)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    num_frame = emission.shape[0]
     num_tokens = len(tokens)
 
     # Trellis has extra diemsions for both time axis and tokens.
     # The extra dim for tokens represents <SoS> (start-of-sentence)
     # The extra dim for time axis is for simplification of the code.
-    trellis = torch.empty((num_frame + 1, num_tokens + 1))
+    trellis = np.empty((num_frame + 1, num_tokens + 1), dtype=np.float32)
     trellis[0, 0] = 0
-    trellis[1:, 0] = torch.cumsum(emission[:, 0], 0)
-    trellis[0, -num_tokens:] = -float("inf")
-    trellis[-num_tokens:, 0] = float("inf")
-
+    # torch accumulates float32 cumsums in double on CPU
+    trellis[1:, 0] = np.cumsum(emission[:, 0], dtype=np.float64)
+    trellis[0, -num_tokens:] = -np.inf
+    trellis[-num_tokens:, 0] = np.inf
+
+    changed = np.zeros((num_frame + 1, num_tokens + 1), dtype=bool)
+    stay_scores = emission[:, blank_id]
+    change_scores = emission[:, tokens]
+    stay = np.empty(num_tokens, dtype=np.float32)
+    change = np.empty(num_tokens, dtype=np.float32)
     for t in range(num_frame):
-        trellis[t + 1, 1:] = torch.maximum(
-            # Score for staying at the same token
-            trellis[t, 1:] + emission[t, blank_id],
-            # Score for changing to the next token
-            trellis[t, :-1] + emission[t, tokens],
-        )
-    return trellis
+        # Score for staying at the same token
+        np.add(trellis[t, 1:], stay_scores[t], out=stay)
+        # Score for changing to the next token
+        np.add(trellis[t, :-1], change_scores[t], out=change)
+        np.greater(change, stay, out=changed[t + 1, 1:])
+        np.maximum(stay, change, out=trellis[t + 1, 1:])
+    return trellis, changed
 
 @dataclass
-class Point:
-    token_index: int
-    time_index: int
-    score: float
+class TokenSpans:
+    """Frames [starts[i], ends[i]) of emission aligned to token i, with its mean frame probability"""
+    starts: np.ndarray
+    ends: np.ndarray
+    scores: np.ndarray
+
+    def __len__(self):
+        return len(self.starts)
 
-def backtrack(trellis, emission, tokens, blank_id=0):
+def backtrack(trellis, changed, emission, tokens, blank_id=0):
+    """Spans of every token on the best path, None if the path does not reach the first token"""
     # Note:
     # j and t are indices for trellis, which has extra dimensions
     # for time and tokens at the beginning.
@@ -392,33 +450,36 @@ def backtrack(trellis, emission, tokens, blank_id=0):
     # the corresponding index in emission is `T-1`.
     # Similarly, when referring to token index `J` in trellis,
     # the corresponding index in transcript is `J-1`.
-    j = trellis.size(1) - 1
-    t_start = torch.argmax(trellis[:, j]).item()
-
-    path = []
-    for t in range(t_start, 0, -1):
-        # 1. Figure out if the current position was stay or change
-        # Note (again):
-        # `emission[J-1]` is the emission at time frame `J` of trellis dimension.
-        # Score for token staying the same from time frame J-1 to T.
-        stayed = trellis[t - 1, j] + emission[t - 1, blank_id]
-        # Score for token changing from C-1 at T-1 to J at T.
-        changed = trellis[t - 1, j - 1] + emission[t - 1, tokens[j - 1]]
-
-        # 2. Store the path with frame-wise probability.
-        prob = emission[t - 1, tokens[j - 1] if changed > stayed else 0].exp().item()
-        # Return token index and time index in non-trellis coordinate.
-        path.append(Point(j - 1, t - 1, prob))
-
-        # 3. Update the token
-        if changed > stayed:
-            j -= 1
-            if j == 0:
-                break
-    else:
-        # failed
-        return None
-    return path[::-1]
+    emission = np.asarray(emission, dtype=np.float32)
+    num_tokens = trellis.shape[1] - 1
+    t_start = int(np.argmax(trellis[:, num_tokens]))
+
+    # Walking back, the path stays on token J until the latest frame whose back-pointer changes into it,
+    # so each token is one search in its own row of the transposed back-pointers
+    moves = np.ascontiguousarray(changed.T)
+    entered = np.empty(num_tokens, dtype=np.int64)
+    t = t_start
+    for j in range(num_tokens, 0, -1):
+        if t < 1:
+            # failed
+            return None
+        column = moves[j, t:0:-1]
+        k = int(np.argmax(column))
+        if not column[k]:
+            # failed
+            return None
+        entered[j - 1] = t - k
+        t = t - k - 1
+
+    # Return spans in non-trellis coordinate.
+    starts = entered - 1
+    ends = np.append(starts[1:], t_start)
+    # Frame-wise probability: the token's own on the frame it is entered, index 0 on the frames it stays
+    # torch's exp, numpy's float32 exp can differ from it in the last bit
+    probs = torch.from_numpy(emission[:t_start, 0]).exp().double().numpy()
+    probs[starts] = torch.from_numpy(emission[starts, np.asarray(tokens, dtype=np.int64)]).exp().double().numpy()
+    scores = np.add.reduceat(probs, starts) / (ends - starts)
+    return TokenSpans(starts, ends, scores)
 
 # Merge the labels
 @dataclass
@@ -435,36 +496,20 @@ class Segment:
     def length(self):
         return self.end - self.start
 
-def merge_repeats(path, transcript):
-    i1, i2 = 0, 0
-    segments = []
-    while i1 < len(path):
-        while i2 < len(path) and path[i1].token_index == path[i2].token_index:
-            i2 += 1
-        score = sum(path[k].score for k in range(i1, i2)) / (i2 - i1)
-        segments.append(
-            Segment(
-                transcript[path[i1].token_index],
-                path[i1].time_index,
-                path[i2 - 1].time_index + 1,
-                score,
-            )
-        )
-        i1 = i2
-    return segments
-
-def merge_words(segments, separator="|"):
-    words = []
-    i1, i2 = 0, 0
-    while i1 < len(segments):
-        if i2 >= len(segments) or segments[i2].label == separator:
-            if i1 != i2:
-                segs = segments[i1:i2]
-                word = "".join([seg.label for seg in segs])
-                score = sum(seg.score * seg.length for seg in segs) / sum(seg.length for seg in segs)
-                words.append(Segment(word, segments[i1].start, segments[i2 - 1].end, score))
-            i1 = i2 + 1
-            i2 = i1
-        else:
-            i2 += 1
-    return words
+def merge_words(spans, transcript, separator="|"):
+    """Words of `transcript` (one character per token of `spans`) as Segments, split at `separator`"""
+    is_separator = np.frombuffer(transcript.encode("utf-32-le"), dtype=np.uint32) == ord(separator)
+    # word boundaries are the edges of the non-separator runs
+    edges = np.diff(np.concatenate(([0], (~is_separator).astype(np.int8), [0])))
+    firsts, lasts = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if len(firsts) == 0:
+        return []
+    lengths = spans.ends - spans.starts
+    # reduceat over (first, last) pairs, every other sum is a word; the trailing 0 lets `last` hit the end
+    bounds = np.stack([firsts, lasts], axis=1).ravel()
+    weighted = np.add.reduceat(np.append(spans.scores * lengths, 0), bounds)[::2]
+    total = np.add.reduceat(np.append(lengths, 0), bounds)[::2]
+    return [
+        Segment(transcript[first:last], int(spans.starts[first]), int(spans.ends[last - 1]), float(weight / length))
+        for first, last, weight, length in zip(firsts, lasts, weighted, total)
+    ]